@@ -0,0 +1,243 @@
+"""Headless batch processing of toll booth images.
+
+Runs the same detect -> OCR -> toll pipeline as the Tk app over whole
+directories, globs or file lists, spreading detection and OCR over a pool of
+worker processes. Tolls are settled in the parent process, in input order,
+so the outcomes match what the GUI would have produced one image at a time.
+
+    python batch_process.py Images/ --workers 4
+    python batch_process.py "captures/2025-08-*/*.jpg" --dry-run
+
+With --server the models are not loaded here at all: images are sent to a
+running inference_server.py, which batches them with the other lanes.
+
+    python batch_process.py Images/ --server http://127.0.0.1:8765 --workers 8
+"""
+import argparse
+import glob
+import multiprocessing
+import multiprocessing.util
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from config import (MODEL_PATH, DETECTOR_BACKEND, CROPPED_DIR, VEHICLES_DB_FILE, TOLL_LOG_FILE, DEFAULT_TOLL_AMOUNT,
+                    STORAGE_BACKEND, SQLITE_DB_FILE, METRICS_PORT, METRICS_JSON_FILE)
+from evidence import EvidenceWriter
+from inference_server import RecognitionClient
+from metrics import METRICS, start_http_server
+from recognition import DETECTOR_BACKENDS, export_detector, load_models, detect_batch, recognize_plates
+from dedup import RecognitionCache
+from storage import open_storage
+from toll import TollProcessor
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Per-worker model handles, set up once by _init_worker
+_model = None
+_reader = None
+_evidence_writer = None
+
+
+def collect_images(inputs):
+    """Expand directories, glob patterns and plain paths into a sorted, de-duplicated file list."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = [os.path.join(item, name) for name in os.listdir(item)]
+        elif glob.has_magic(item):
+            candidates = glob.glob(item, recursive=True)
+        else:
+            candidates = [item]
+        paths.extend(sorted(p for p in candidates
+                            if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS)))
+    seen = set()
+    return [p for p in paths if not (p in seen or seen.add(p))]
+
+
+def _init_worker(model_path, backend, evidence_dir, threads):
+    global _model, _reader, _evidence_writer
+    # Keep each worker to its share of the cores, otherwise every process
+    # spins up one torch/OpenCV thread per core and they all fight.
+    import torch
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+
+    _model, _reader = load_models(model_path, backend)
+    if evidence_dir:
+        _evidence_writer = EvidenceWriter(evidence_dir)
+        # Flush queued crops when the pool shuts the worker down cleanly
+        multiprocessing.util.Finalize(_evidence_writer, _evidence_writer.close, exitpriority=10)
+
+
+def _process_chunk(filepaths):
+    """Decode a chunk of images, detect plates in one batched YOLO call, then OCR them."""
+    outcomes = {}
+    images = []
+    for filepath in filepaths:
+        image = cv2.imread(filepath)
+        if image is None:
+            outcomes[filepath] = (filepath, None, "Could not read image file.")
+        else:
+            images.append((filepath, image))
+
+    try:
+        detections = detect_batch(_model, [image for _, image in images]) if images else []
+    except Exception as e:
+        detections = None
+        for filepath, _ in images:
+            outcomes[filepath] = (filepath, None, str(e))
+
+    if detections is not None:
+        for (filepath, image), det in zip(images, detections):
+            try:
+                outcomes[filepath] = (filepath, recognize_plates(_model, _reader, image, filepath,
+                                                                 _evidence_writer, detections=det), None)
+            except Exception as e:
+                outcomes[filepath] = (filepath, None, str(e))
+    # Worker timings travel back with the results and are merged into the
+    # parent's registry, which is the one that gets exported.
+    return [outcomes[filepath] for filepath in filepaths], METRICS.drain()
+
+
+def _merge_worker_metrics(chunk_results):
+    for outcomes, worker_metrics in chunk_results:
+        METRICS.merge(worker_metrics)
+        yield from outcomes
+
+
+def run_batch(paths, workers=None, model_path=MODEL_PATH, evidence_dir=None,
+              toll_processor=None, on_result=None, batch_size=1, backend=DETECTOR_BACKEND):
+    """Recognize plates in `paths` and settle tolls for them.
+
+    `toll_processor` may be None for a dry run (recognition only). Plate
+    crops are kept as evidence in `evidence_dir` only when it is given.
+    `on_result(filepath, detected_texts, error, toll_results)` is called once
+    per image, in input order. Each worker sends `batch_size` images at a
+    time through the detector in a single call.
+
+    Returns the elapsed wall time in seconds.
+    """
+    workers = workers or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    start = time.perf_counter()
+    export_detector(model_path, backend) # Once here, not racing in every worker
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(model_path, backend, evidence_dir, threads)) as pool:
+        # imap keeps input order so tolls are charged in the same sequence
+        # as a sequential run would charge them.
+        chunks = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+        for outcome in _merge_worker_metrics(pool.imap(_process_chunk, chunks)):
+            _settle(outcome, toll_processor, on_result)
+        pool.close()
+        pool.join() # Let workers exit normally so pending evidence gets written
+    return time.perf_counter() - start
+
+
+def _settle(outcome, toll_processor, on_result):
+    filepath, detected_texts, error = outcome
+    toll_results = []
+    if toll_processor is not None and detected_texts:
+        for det_plate_info in detected_texts:
+            toll_results.append(toll_processor.process_plate(
+                det_plate_info['raw_plate'], det_plate_info['image_ref'], det_plate_info.get('candidates')))
+    if on_result:
+        on_result(filepath, detected_texts, error, toll_results)
+
+
+def run_batch_remote(paths, server_url, workers=None, toll_processor=None, on_result=None):
+    """Like run_batch, but recognition is done by the inference server at `server_url`.
+
+    `workers` threads keep that many requests in flight so the server can
+    batch them; tolls are still settled here, in input order.
+    """
+    client = RecognitionClient(server_url)
+
+    def recognize(filepath):
+        try:
+            return filepath, client.recognize_file(filepath), None
+        except Exception as e:
+            return filepath, None, str(e)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        for outcome in pool.map(recognize, paths): # map keeps input order
+            _settle(outcome, toll_processor, on_result)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run plate recognition and toll processing over many images.")
+    parser.add_argument('inputs', nargs='+', help="Image files, directories or glob patterns")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help="Number of worker processes, or concurrent requests with --server (default: CPU count)")
+    parser.add_argument('-b', '--batch-size', type=int, default=1,
+                        help="Images per YOLO call inside each worker (default: 1)")
+    parser.add_argument('--model', default=MODEL_PATH, help="Path to the YOLO weights")
+    parser.add_argument('--backend', choices=DETECTOR_BACKENDS, default=DETECTOR_BACKEND,
+                        help="Detector runtime (onnx/openvino export the weights once)")
+    parser.add_argument('--save-evidence', action='store_true', help="Keep plate crops as evidence images")
+    parser.add_argument('--cropped-dir', default=CROPPED_DIR, help="Where evidence crops are written")
+    parser.add_argument('--storage', choices=['csv', 'sqlite'], default=STORAGE_BACKEND)
+    parser.add_argument('--vehicles-db', default=VEHICLES_DB_FILE)
+    parser.add_argument('--toll-log', default=TOLL_LOG_FILE)
+    parser.add_argument('--db', default=SQLITE_DB_FILE, help="SQLite database (with --storage sqlite)")
+    parser.add_argument('--toll-amount', type=float, default=DEFAULT_TOLL_AMOUNT)
+    # Off by default: the window runs on processing time, and a backfill goes
+    # through hours of captures in seconds, so real repeat visits would be
+    # taken for duplicates and never charged.
+    parser.add_argument('--dedup-ttl', type=float, default=0,
+                        help="Seconds of processing time a plate is not charged again after a read"
+                             " (default 0 = charge every read, like the app one image at a time)")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help="Serve Prometheus metrics on this local port while running (0 = off)")
+    parser.add_argument('--metrics-json', default=METRICS_JSON_FILE, help="Write metrics as JSON here when done")
+    parser.add_argument('--server', help="Use a running inference server (http://host:port or unix:///path.sock)")
+    parser.add_argument('--dry-run', action='store_true', help="Recognize plates only, do not charge tolls")
+    args = parser.parse_args(argv)
+
+    paths = collect_images(args.inputs)
+    if not paths:
+        parser.error("No images found.")
+
+    toll_processor = None
+    if not args.dry_run:
+        storage = open_storage(args.storage, args.vehicles_db, args.toll_log, args.db)
+        toll_processor = TollProcessor(storage, args.toll_amount, cache=RecognitionCache(ttl=args.dedup_ttl))
+
+    def report(filepath, detected_texts, error, toll_results):
+        name = os.path.basename(filepath)
+        if error:
+            print(f"{name}: ERROR {error}")
+        elif detected_texts is None:
+            print(f"{name}: no objects detected")
+        elif not detected_texts:
+            print(f"{name}: no plates read")
+        elif toll_results:
+            for r in toll_results:
+                duplicate = " [duplicate, not charged]" if r['duplicate'] else ""
+                print(f"{name}: {r['plate']} {r['status']} (owner: {r['owner']}, balance: {r['balance']}){duplicate}")
+        else:
+            print(f"{name}: " + ", ".join(d['raw_plate'] for d in detected_texts))
+
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    print(f"Processing {len(paths)} images with {args.workers} workers...")
+    if args.server:
+        elapsed = run_batch_remote(paths, args.server, args.workers, toll_processor, report)
+    else:
+        elapsed = run_batch(paths, args.workers, args.model, args.cropped_dir if args.save_evidence else None,
+                            toll_processor, report,
+                            batch_size=max(1, args.batch_size), backend=args.backend)
+    if toll_processor is not None:
+        toll_processor.storage.close()
+    print(f"Processed {len(paths)} images in {elapsed:.2f}s ({len(paths) / elapsed:.2f} images/sec)")
+    if args.metrics_json:
+        METRICS.dump_json(args.metrics_json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Collect work queued by many callers into batches.
+
+Used by BatchDetector (one YOLO call per batch) and SettlementEngine (one
+storage write per batch).
+"""
+import queue
+import time
+
+
+def next_batch(work_queue, max_size, max_delay):
+    """Take the next batch of items from `work_queue`.
+
+    Items are tuples whose last element is the time.monotonic() they were
+    queued at. Blocks for the first item, then collects more until
+    `max_size` are taken or the first has waited `max_delay` seconds;
+    items already waiting are always taken, so with `max_delay` 0 a batch
+    is whatever queued up while the previous one was being handled.
+    None on the queue is the stop marker: returns None when it comes
+    first, otherwise ends the batch and leaves it for the next call.
+    """
+    item = work_queue.get()
+    if item is None:
+        return None
+    batch = [item]
+    deadline = item[-1] + max_delay
+    while len(batch) < max_size:
+        remaining = deadline - time.monotonic()
+        try:
+            item = work_queue.get(timeout=remaining) if remaining > 0 else work_queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is None:
+            # Finish this batch first, then stop
+            work_queue.put(None)
+            break
+        batch.append(item)
+    return batch
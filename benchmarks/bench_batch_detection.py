@@ -0,0 +1,52 @@
+"""Compare YOLO detection throughput at different batch sizes on CPU.
+
+    python benchmarks/bench_batch_detection.py --frames 64
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ultralytics import YOLO  # noqa: E402
+
+from recognition import detect_batch  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=os.path.join(ROOT, 'yolov8_model', 'best.pt'))
+    parser.add_argument('--images', default=os.path.join(ROOT, 'Images', '*.jpg'))
+    parser.add_argument('--frames', type=int, default=64, help="Frames per measurement (images are repeated)")
+    parser.add_argument('--batch-sizes', default='1,4,8,16')
+    args = parser.parse_args()
+
+    images = [cv2.imread(p) for p in sorted(glob.glob(args.images))]
+    images = [im for im in images if im is not None]
+    if not images:
+        sys.exit(f"No images matched {args.images}")
+    frames = [images[i % len(images)] for i in range(args.frames)]
+
+    model = YOLO(args.model)
+    model.to('cpu')
+    detect_batch(model, images[:1]) # Warm up: first call builds the predictor
+
+    print(f"{'batch':>5} {'seconds':>8} {'images/sec':>11} {'speedup':>8}")
+    baseline = None
+    for batch_size in (int(b) for b in args.batch_sizes.split(',')):
+        start = time.perf_counter()
+        for i in range(0, len(frames), batch_size):
+            detect_batch(model, frames[i:i + batch_size])
+        elapsed = time.perf_counter() - start
+        rate = len(frames) / elapsed
+        baseline = baseline or rate
+        print(f"{batch_size:>5} {elapsed:>8.2f} {rate:>11.2f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Check ONNX Runtime / OpenVINO detections against PyTorch and compare throughput.
+
+For every image, each exported backend's boxes are matched to the PyTorch
+boxes (IoU >= --iou). Parity fails (exit status 1) if any PyTorch box is
+missed, any extra box appears, or a matched confidence differs by more than
+--conf-tolerance. Throughput is measured afterwards at batch size 1 and
+--batch-size.
+
+    python benchmarks/bench_detector_backends.py --backends onnx,openvino --frames 64
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ultralytics import YOLO  # noqa: E402
+
+from recognition import detect_batch, export_detector  # noqa: E402
+from stream import box_iou  # noqa: E402
+
+
+def compare(reference, candidate, iou_threshold):
+    """Returns (missed, extra, largest confidence difference) for one image."""
+    ref = [] if reference is None else list(zip(reference.boxes, reference.confidences))
+    cand = [] if candidate is None else list(zip(candidate.boxes, candidate.confidences))
+    unmatched = list(range(len(cand)))
+    missed = 0
+    worst = 0.0
+    for box, conf in ref:
+        best, best_iou = None, iou_threshold
+        for j in unmatched:
+            iou = box_iou(box, cand[j][0])
+            if iou >= best_iou:
+                best, best_iou = j, iou
+        if best is None:
+            missed += 1
+            continue
+        unmatched.remove(best)
+        worst = max(worst, abs(float(conf) - float(cand[best][1])))
+    return missed, len(unmatched), worst
+
+
+def throughput(model, frames, batch_size):
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        detect_batch(model, frames[i:i + batch_size])
+    return len(frames) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=os.path.join(ROOT, 'yolov8_model', 'best.pt'))
+    parser.add_argument('--images', default=os.path.join(ROOT, 'Images', '*.jpg'))
+    parser.add_argument('--backends', default='onnx,openvino')
+    parser.add_argument('--frames', type=int, default=64, help="Frames per throughput run (images are repeated)")
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--iou', type=float, default=0.9, help="IoU for a box to count as the same detection")
+    parser.add_argument('--conf-tolerance', type=float, default=0.02)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(args.images))
+    images = [(p, cv2.imread(p)) for p in paths]
+    images = [(p, im) for p, im in images if im is not None]
+    if not images:
+        sys.exit(f"No images matched {args.images}")
+    frames = [images[i % len(images)][1] for i in range(args.frames)]
+
+    models = {'torch': YOLO(args.model)}
+    models['torch'].to('cpu')
+    for backend in args.backends.split(','):
+        models[backend] = YOLO(export_detector(args.model, backend), task='detect')
+
+    reference = [detect_batch(models['torch'], [im])[0] for _, im in images]
+    parity_ok = True
+    print(f"{'backend':>9} {'missed':>7} {'extra':>6} {'max dconf':>10}")
+    for backend, model in models.items():
+        if backend == 'torch':
+            continue
+        missed = extra = 0
+        worst = 0.0
+        for (path, im), ref in zip(images, reference):
+            m, e, w = compare(ref, detect_batch(model, [im])[0], args.iou)
+            if m or e:
+                print(f"  {backend}: {os.path.basename(path)} missed {m}, extra {e}")
+            missed, extra, worst = missed + m, extra + e, max(worst, w)
+        parity_ok = parity_ok and not missed and not extra and worst <= args.conf_tolerance
+        print(f"{backend:>9} {missed:>7} {extra:>6} {worst:>10.4f}")
+
+    print(f"\n{'backend':>9} {'img/s b=1':>10} {f'img/s b={args.batch_size}':>11} {'speedup':>8}")
+    baseline = None
+    for backend, model in models.items():
+        detect_batch(model, frames[:1]) # Warm up
+        single = throughput(model, frames, 1)
+        batched = throughput(model, frames, args.batch_size)
+        baseline = baseline or single
+        print(f"{backend:>9} {single:>10.2f} {batched:>11.2f} {max(single, batched) / baseline:>7.2f}x")
+
+    if not parity_ok:
+        sys.exit("Parity check failed.")
+
+
+if __name__ == "__main__":
+    main()
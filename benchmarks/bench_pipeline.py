@@ -0,0 +1,224 @@
+"""End-to-end benchmark of the recognition and toll pipeline, without the Tk UI.
+
+Drives the same RecognitionPipeline the app uses (decode, detection,
+cropping, OCR, plate text, toll settlement through SettlementEngine, toll log
+and vehicle persistence) over the bundled Images/, against a scratch copy
+of the data scaled up with synthetic vehicles and log rows. Prints one JSON
+document with throughput, per-stage latency (p50/p95/p99) and peak RSS.
+
+    python benchmarks/bench_pipeline.py --repeat 20 --vehicles 100000 --log-rows 200000 -o run.json
+    python benchmarks/bench_pipeline.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json --tolerance 0.15
+
+With --baseline the run fails (exit status 1) if throughput dropped, or a
+stage's p95 latency or the peak RSS grew, by more than --tolerance.
+--settle-only skips the models and feeds synthetic reads straight into
+settlement, to benchmark storage changes on machines without the models.
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import string
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import (VEHICLE_FIELDS, TOLL_LOG_FIELDS, DETECTOR_BACKEND, SETTLEMENT_BATCH_SIZE,  # noqa: E402
+                    SETTLEMENT_MAX_DELAY)
+from metrics import METRICS  # noqa: E402
+from settlement import SettlementEngine  # noqa: E402
+from storage import open_storage  # noqa: E402
+
+# p95 latencies this small are mostly timer noise, don't flag them
+MIN_LATENCY_DELTA = 0.002
+
+
+def synthetic_plate(rng):
+    return ("".join(rng.choices(string.ascii_uppercase, k=3)) +
+            "".join(rng.choices(string.digits, k=rng.randint(3, 4))))
+
+
+def make_dataset(directory, n_vehicles, n_log_rows, seed):
+    """Write vehicles and toll log CSVs: the repo's own rows plus synthetic ones. Returns the plates."""
+    rng = random.Random(seed)
+    with open(os.path.join(ROOT, 'vehicles_db.csv'), newline='', encoding='utf-8') as f:
+        vehicles = list(csv.DictReader(f))
+    plates = {v['plate'] for v in vehicles}
+    while len(vehicles) < n_vehicles:
+        plate = synthetic_plate(rng)
+        if plate not in plates:
+            plates.add(plate)
+            vehicles.append({'plate': plate, 'owner': f"Owner {len(vehicles)}",
+                             'type': rng.choice(['Car', 'Van', 'Truck']), 'balance': f"{rng.uniform(0, 200):.2f}"})
+    with open(os.path.join(directory, 'vehicles_db.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=VEHICLE_FIELDS)
+        writer.writeheader()
+        writer.writerows(vehicles)
+
+    plate_list = sorted(plates)
+    start = time.mktime((2025, 1, 1, 0, 0, 0, 0, 0, -1))
+    with open(os.path.join(directory, 'toll_log.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(TOLL_LOG_FIELDS)
+        for i in range(n_log_rows):
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start + i * 30))
+            writer.writerow([stamp, rng.choice(plate_list), "10.00",
+                             rng.choice(["Auto-Paid", "Unpaid - Low Balance", "Unpaid - Unregistered"]),
+                             f"cropped_{i}.jpg"])
+    return plate_list
+
+
+def run_pipeline(paths, args, toll_processor):
+    from pipeline import RecognitionPipeline
+    from recognition import ModelLoader
+
+    load_start = time.perf_counter()
+    model, reader = ModelLoader(args.model, backend=args.backend).wait()
+    load_seconds = time.perf_counter() - load_start
+
+    pipeline = RecognitionPipeline(model, reader, toll_processor)
+    plates_read = 0
+    done = 0
+    start = time.perf_counter()
+    pending = list(paths)
+    while done < len(paths):
+        while pending and pipeline.submit(pending[0]) is not None:
+            pending.pop(0)
+        job = pipeline.results.get()
+        done += 1
+        if job.error:
+            print(f"{job.filepath}: {job.error}", file=sys.stderr)
+        plates_read += len(job.detected_texts or [])
+    elapsed = time.perf_counter() - start
+    pipeline.close()
+    return elapsed, {'model_load_seconds': load_seconds, 'plates_read': plates_read}
+
+
+def run_settle_only(n_reads, plates, args, toll_processor):
+    rng = random.Random(args.seed + 1)
+    start = time.perf_counter()
+    for i in range(n_reads):
+        # Mostly registered plates, some strangers, like a real lane
+        plate = rng.choice(plates) if rng.random() < 0.9 else synthetic_plate(rng)
+        toll_processor.process_plate(plate, f"cropped_bench_{i}.jpg")
+    return time.perf_counter() - start, {'plates_read': n_reads}
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def compare(result, baseline, tolerance):
+    """List of regressions of `result` against `baseline`, empty if none."""
+    regressions = []
+    if result['throughput'] < baseline['throughput'] * (1 - tolerance):
+        regressions.append(f"throughput {result['throughput']:.2f}/s"
+                           f" vs baseline {baseline['throughput']:.2f}/s")
+    for stage, stats in baseline['latency_seconds'].items():
+        current = result['latency_seconds'].get(stage)
+        if current is None:
+            continue
+        if current['p95'] > stats['p95'] * (1 + tolerance) and current['p95'] - stats['p95'] > MIN_LATENCY_DELTA:
+            regressions.append(f"{stage} p95 {current['p95'] * 1000:.1f}ms"
+                               f" vs baseline {stats['p95'] * 1000:.1f}ms")
+    if result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        regressions.append(f"peak RSS {result['peak_rss_mb']:.0f}MB vs baseline {baseline['peak_rss_mb']:.0f}MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', default=os.path.join(ROOT, 'Images', '*.jpg'))
+    parser.add_argument('--repeat', type=int, default=10, help="Times each image is fed through")
+    parser.add_argument('--vehicles', type=int, default=10000,
+                        help="Registered vehicles (synthetic beyond the repo's)")
+    parser.add_argument('--log-rows', type=int, default=100000, help="Existing toll log rows")
+    parser.add_argument('--storage', choices=['csv', 'sqlite'], default='csv')
+    parser.add_argument('--model', default=os.path.join(ROOT, 'yolov8_model', 'best.pt'))
+    parser.add_argument('--backend', default=DETECTOR_BACKEND)
+    parser.add_argument('--settle-only', type=int, metavar='N',
+                        help="Skip the models: settle N synthetic plate reads instead")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('-o', '--output', help="Also write the JSON result here")
+    parser.add_argument('--save-baseline', help="Write the result as a baseline file")
+    parser.add_argument('--baseline', help="Compare against this baseline and fail on regression")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Allowed relative regression (default 0.10)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="toll_bench_")
+    try:
+        plates = make_dataset(workdir, args.vehicles, args.log_rows, args.seed)
+        storage = open_storage(args.storage, os.path.join(workdir, 'vehicles_db.csv'),
+                               os.path.join(workdir, 'toll_log.csv'), os.path.join(workdir, 'toll_system.db'))
+        if args.storage == 'sqlite':
+            storage.import_csv(os.path.join(workdir, 'vehicles_db.csv'), os.path.join(workdir, 'toll_log.csv'))
+        # Settle like the app does; no dedup cache: every read should reach storage
+        toll_processor = SettlementEngine(storage, cache=None)
+        METRICS.drain() # Only measure the run itself
+
+        if args.settle_only:
+            n_items = args.settle_only
+            elapsed, extra = run_settle_only(n_items, plates, args, toll_processor)
+        else:
+            paths = sorted(glob.glob(args.images)) * args.repeat
+            if not paths:
+                sys.exit(f"No images matched {args.images}")
+            n_items = len(paths)
+            elapsed, extra = run_pipeline(paths, args, toll_processor)
+        toll_processor.close() # Settle anything still queued before reading the metrics
+        storage.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    snapshot = METRICS.snapshot()
+    result = {
+        'mode': 'settle-only' if args.settle_only else 'pipeline',
+        'items': n_items,
+        'seconds': elapsed,
+        'throughput': n_items / elapsed,
+        'latency_seconds': {name[len('stage_seconds{stage="'):-2]: stats
+                            for name, stats in snapshot['latency_seconds'].items()
+                            if name.startswith('stage_seconds{')},
+        'counters': snapshot['counters'],
+        'peak_rss_mb': peak_rss_mb(),
+        'config': {'storage': args.storage, 'vehicles': args.vehicles, 'log_rows': args.log_rows,
+                   'repeat': args.repeat, 'backend': args.backend, 'seed': args.seed,
+                   'settlement_batch_size': SETTLEMENT_BATCH_SIZE, 'settlement_max_delay': SETTLEMENT_MAX_DELAY},
+        'platform': {'python': platform.python_version(), 'machine': platform.machine(),
+                     'cpus': os.cpu_count()},
+        **extra,
+    }
+
+    text = json.dumps(result, indent=2, sort_keys=True)
+    print(text)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('mode') != result['mode']:
+            sys.exit(f"Baseline is a {baseline.get('mode')} run, this is a {result['mode']} run.")
+        regressions = compare(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%}).", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Load and lookup times of the indexed VehicleRegistry versus the old list-of-dicts scan.
+
+    python benchmarks/bench_registry.py --sizes 10000,100000,1000000
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import VEHICLE_FIELDS  # noqa: E402
+from registry import VehicleRegistry  # noqa: E402
+
+
+def synthetic_plate(i):
+    return f"BM{i:08d}"
+
+
+def write_vehicles(filename, n):
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(VEHICLE_FIELDS)
+        for i in range(n):
+            writer.writerow([synthetic_plate(i), f"Owner {i}", 'Car', '50.00'])
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def load_dicts(filename):
+    with open(filename, 'r', newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def scan(vehicles_data, plate):
+    for v in vehicles_data:
+        if v['plate'] == plate:
+            return v
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--scan-lookups', type=int, default=200,
+                        help="Lookups measured for the linear scan (it is far too slow for the full count)")
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'load dicts':>11} {'load index':>11} {'MB dicts':>9} {'MB index':>9}"
+          f" {'scan us/op':>11} {'index us/op':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in (int(x) for x in args.sizes.split(',')):
+            filename = os.path.join(tmp, f"vehicles_{n}.csv")
+            write_vehicles(filename, n)
+
+            tracemalloc.start()
+            vehicles_data, t_dicts = timed(load_dicts, filename)
+            mb_dicts = tracemalloc.get_traced_memory()[0] / 2**20
+            tracemalloc.stop()
+
+            tracemalloc.start()
+            registry, t_index = timed(VehicleRegistry.from_csv, filename)
+            mb_index = tracemalloc.get_traced_memory()[0] / 2**20
+            tracemalloc.stop()
+
+            # Half hits, half misses, like a real mix of registered and unregistered cars
+            plates = [synthetic_plate(random.randrange(n * 2)) for _ in range(args.lookups)]
+
+            start = time.perf_counter()
+            for plate in plates[:args.scan_lookups]:
+                scan(vehicles_data, plate)
+            scan_us = (time.perf_counter() - start) / args.scan_lookups * 1e6
+
+            start = time.perf_counter()
+            for plate in plates:
+                registry.find(plate)
+            index_us = (time.perf_counter() - start) / len(plates) * 1e6
+
+            print(f"{n:>9} {t_dicts:>10.2f}s {t_index:>10.2f}s {mb_dicts:>9.1f} {mb_index:>9.1f}"
+                  f" {scan_us:>11.1f} {index_us:>12.3f}")
+            del vehicles_data, registry
+
+
+if __name__ == "__main__":
+    main()
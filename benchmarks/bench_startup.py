@@ -0,0 +1,64 @@
+"""Measure time-to-first-window and time-to-first-inference of the Tk app.
+
+Each run starts a fresh interpreter (so import costs are included), builds
+TollManagementApp, and records when the window is first drawn and when the
+first detection + OCR on a sample image completes. Needs a display.
+
+    python benchmarks/bench_startup.py --runs 3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(launched_at, image_path):
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import tkinter as tk
+    import main
+
+    root = tk.Tk()
+    app = main.TollManagementApp(root)
+    root.update()
+    first_window = time.time() - launched_at
+
+    model, reader = app.models.wait()
+    import cv2
+    from recognition import recognize_plates
+    recognize_plates(model, reader, cv2.imread(image_path), image_path)
+    first_inference = time.time() - launched_at
+
+    root.destroy()
+    print(json.dumps({'first_window': first_window, 'first_inference': first_inference}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--image', default=os.path.join(ROOT, 'Images', '1111.jpg'))
+    parser.add_argument('--child', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        child(args.child, args.image)
+        return
+
+    runs = []
+    for i in range(args.runs):
+        out = subprocess.run([sys.executable, __file__, '--image', args.image, '--child', repr(time.time())],
+                             check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+        print(f"run {i + 1}: first window {runs[-1]['first_window']:.2f}s, "
+              f"first inference {runs[-1]['first_inference']:.2f}s")
+    print(f"median: first window {statistics.median(r['first_window'] for r in runs):.2f}s, "
+          f"first inference {statistics.median(r['first_inference'] for r in runs):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Stress test of multi-lane settlement (settlement.py).
+
+Many lane threads submit plate events for a small set of accounts at once,
+so the same balance is hit from several lanes in every batch. Some events
+are sent again with the same event id, like a lane retrying after a
+timeout, and some plates are not registered. Afterwards every account must
+satisfy
+
+    final balance = initial balance - toll amount x its Auto-Paid log rows
+
+and the toll log must hold exactly one row per distinct event.
+
+    python benchmarks/stress_settlement.py --lanes 16 --events 2000 --storage sqlite
+    python benchmarks/stress_settlement.py --storage sqlite --processes 4
+
+With --processes several processes, each with its own engine and lanes,
+settle against the same SQLite database. Exits with status 1 on any
+mismatch.
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import VEHICLE_FIELDS, TOLL_LOG_FIELDS  # noqa: E402
+from settlement import SettlementEngine  # noqa: E402
+from storage import open_storage  # noqa: E402
+
+TOLL_AMOUNT = 10.0
+
+
+def make_vehicles(path, n_vehicles, seed):
+    """Write a vehicles CSV with mixed balances (some run out during the test). Returns {plate: balance}."""
+    rng = random.Random(seed)
+    balances = {}
+    while len(balances) < n_vehicles:
+        plate = "".join(rng.choices(string.ascii_uppercase, k=3)) + "".join(rng.choices(string.digits, k=4))
+        balances[plate] = round(rng.uniform(0, 40) if rng.random() < 0.3 else rng.uniform(100, 5000), 2)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(VEHICLE_FIELDS)
+        for i, (plate, balance) in enumerate(balances.items()):
+            writer.writerow([plate, f"Owner {i}", 'Car', f"{balance:.2f}"])
+    with open(os.path.splitext(path)[0] + '_log.csv', 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerow(TOLL_LOG_FIELDS)
+    return balances
+
+
+def open_test_storage(args, workdir):
+    return open_storage(args.storage, os.path.join(workdir, 'vehicles_db.csv'),
+                        os.path.join(workdir, 'vehicles_db_log.csv'), os.path.join(workdir, 'toll_system.db'))
+
+
+def run_lanes(args, workdir, plates, worker):
+    """Settle this worker's share of events. Returns (distinct events submitted, retries)."""
+    storage = open_test_storage(args, workdir)
+    engine = SettlementEngine(storage, TOLL_AMOUNT, cache=None)
+    counts = Counter()
+    lock = threading.Lock()
+
+    def lane(lane_id):
+        rng = random.Random(args.seed * 1000 + worker * 100 + lane_id)
+        sent = []
+        for i in range(args.events):
+            plate = rng.choice(plates) if rng.random() < 0.95 else "ZZZ" + str(rng.randint(0, 9999))
+            event_id = f"w{worker}-lane{lane_id}-{i}"
+            futures = [engine.submit(plate, f"{event_id}.jpg", event_id=event_id)]
+            if rng.random() < args.retry_rate:
+                futures.append(engine.submit(plate, f"{event_id}.jpg", event_id=event_id))
+            sent.append(futures)
+        retries = 0
+        for futures in sent:
+            results = [f.result() for f in futures]
+            # A retry must get the original outcome back without a new charge
+            if any(r['status'] != results[0]['status'] for r in results):
+                raise AssertionError(f"Retry changed the outcome: {results}")
+            retries += sum(r['duplicate'] for r in results[1:])
+        with lock:
+            counts['events'] += args.events
+            counts['retries'] += retries
+
+    threads = [threading.Thread(target=lane, args=(i,)) for i in range(args.lanes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.close()
+    storage.close()
+    return counts['events'], counts['retries']
+
+
+def check(args, workdir, initial, expected_events):
+    """Compare balances and log rows with what was submitted. Returns a list of problems."""
+    storage = open_test_storage(args, workdir)
+    try:
+        final = {v.plate: float(v.balance) for v in storage.vehicles()}
+        paid = Counter()
+        rows = 0
+        for entry in storage.log_reader().read_new():
+            rows += 1
+            if entry['status'] == "Auto-Paid":
+                paid[entry['plate']] += float(entry['amount'])
+    finally:
+        storage.close()
+
+    problems = []
+    if rows != expected_events:
+        problems.append(f"{rows} toll log rows for {expected_events} distinct events")
+    for plate, balance in initial.items():
+        expected = balance - paid[plate]
+        if abs(final[plate] - expected) > 0.005:
+            problems.append(f"{plate}: balance {final[plate]:.2f}, expected {balance:.2f} - {paid[plate]:.2f}"
+                            f" = {expected:.2f}")
+        if final[plate] < -0.005:
+            problems.append(f"{plate}: negative balance {final[plate]:.2f}")
+    return problems, rows, sum(paid.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--storage', choices=['csv', 'sqlite'], default='sqlite')
+    parser.add_argument('--lanes', type=int, default=16, help="Lane threads per process")
+    parser.add_argument('--events', type=int, default=500, help="Events per lane")
+    parser.add_argument('--vehicles', type=int, default=50, help="Accounts (few, so lanes contend)")
+    parser.add_argument('--retry-rate', type=float, default=0.1, help="Share of events sent twice")
+    parser.add_argument('--processes', type=int, default=1, help="Processes sharing the database (SQLite only)")
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+    if args.processes > 1 and args.storage != 'sqlite':
+        sys.exit("Several processes can only share SQLite storage.")
+
+    workdir = tempfile.mkdtemp(prefix="toll_stress_")
+    try:
+        initial = make_vehicles(os.path.join(workdir, 'vehicles_db.csv'), args.vehicles, args.seed)
+        if args.storage == 'sqlite':
+            storage = open_test_storage(args, workdir)
+            storage.import_csv(os.path.join(workdir, 'vehicles_db.csv'), os.path.join(workdir, 'vehicles_db_log.csv'))
+            storage.close()
+        plates = sorted(initial)
+
+        start = time.perf_counter()
+        if args.processes > 1:
+            with multiprocessing.Pool(args.processes) as pool:
+                counts = pool.starmap(run_lanes, [(args, workdir, plates, w) for w in range(args.processes)])
+        else:
+            counts = [run_lanes(args, workdir, plates, 0)]
+        elapsed = time.perf_counter() - start
+        events = sum(n for n, _ in counts)
+        retries = sum(r for _, r in counts)
+
+        problems, rows, paid = check(args, workdir, initial, events)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.storage}: {args.processes} process(es) x {args.lanes} lanes, {events} events"
+          f" + {retries} retries in {elapsed:.2f}s ({(events + retries) / elapsed:.0f}/s)")
+    print(f"{rows} log rows, {paid:.2f} auto-paid across {len(initial)} accounts")
+    for problem in problems[:20]:
+        print(f"MISMATCH: {problem}", file=sys.stderr)
+    if problems:
+        sys.exit(1)
+    print("All balances equal initial balance minus logged Auto-Paid amounts.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Bulk vehicle import/export and balance top-ups.
+
+Whole files are validated at once with pandas (column operations, no
+per-row Python loop) and the accepted rows are applied with a single
+persist: one file write for CSV storage, one transaction for SQLite.
+CSV files need pandas; Parquet and Arrow/Feather files also need pyarrow.
+
+    python bulk.py import fleet.parquet --errors rejected.csv
+    python bulk.py topup payments.csv
+    python bulk.py export vehicles.parquet
+"""
+import argparse
+import csv
+import os
+
+from config import (STORAGE_BACKEND, VEHICLES_DB_FILE, TOLL_LOG_FILE, SQLITE_DB_FILE, VEHICLE_FIELDS,
+                    PLATE_GRAMMARS)
+from storage import open_storage
+
+TOPUP_FIELDS = ['plate', 'amount']
+
+
+def _pandas():
+    try:
+        import pandas as pd
+    except ImportError:
+        raise RuntimeError("Bulk import needs pandas (pip install pandas; add pyarrow for Parquet files).")
+    return pd
+
+
+def _format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.parquet', '.pq'):
+        return 'parquet'
+    if ext in ('.arrow', '.feather'):
+        return 'feather'
+    raise ValueError(f"Unsupported file type {ext!r}: use .csv, .parquet or .arrow/.feather")
+
+
+def read_table(path, fields):
+    """Load `path` as a DataFrame of strings with (at least) the `fields` columns."""
+    pd = _pandas()
+    fmt = _format(path)
+    if fmt == 'csv':
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    elif fmt == 'parquet':
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_feather(path)
+    missing = [field for field in fields if field not in df.columns]
+    if missing:
+        raise ValueError(f"{os.path.basename(path)} is missing columns: {', '.join(missing)}")
+    # Nulls (Parquet/Arrow) become empty cells, rejected like blanks in a CSV
+    df = df[fields].fillna('').astype(str).apply(lambda col: col.str.strip())
+    # Line numbers as seen in a spreadsheet: header is line 1
+    df.index = pd.RangeIndex(2, len(df) + 2, name='line')
+    return df
+
+
+def _errors(df, checks):
+    """Collect (mask, message) checks into a DataFrame of rejected lines with their first error."""
+    pd = _pandas()
+    error = pd.Series('', index=df.index)
+    for mask, message in checks:
+        error = error.mask((error == '') & mask, message)
+    rejected = df[error != ''].assign(error=error[error != ''])
+    return df[error == ''], rejected
+
+
+def validate_vehicles(df, registered, update_existing=False, check_format=True):
+    """Split vehicle rows into (accepted, rejected) DataFrames.
+
+    Plates are upper-cased. Rejected: empty fields, plates that appear more
+    than once in the file, plates outside PLATE_GRAMMARS (with
+    `check_format`), balances that are not numbers or are negative, and
+    plates already registered unless `update_existing`.
+    """
+    pd = _pandas()
+    df = df.assign(plate=df['plate'].str.upper())
+    balance = pd.to_numeric(df['balance'], errors='coerce')
+    plate_pattern = "|".join(f"(?:{grammar})" for grammar in PLATE_GRAMMARS)
+    checks = [
+        ((df[VEHICLE_FIELDS] == '').any(axis=1), "missing field"),
+        (df['plate'].duplicated(keep=False), "duplicate plate in file"),
+        (balance.isna(), "balance is not a number"),
+        (balance < 0, "negative balance"),
+    ]
+    if check_format:
+        checks.append((~df['plate'].str.fullmatch(plate_pattern), "plate does not match any plate format"))
+    if not update_existing:
+        checks.append((df['plate'].isin(registered), "plate already registered"))
+    accepted, rejected = _errors(df, checks)
+    accepted = accepted.assign(balance=balance[accepted.index].map("{:.2f}".format))
+    return accepted, rejected
+
+
+def validate_topups(df, registered):
+    """Split payment rows into ({plate: total amount}, rejected DataFrame).
+
+    Amounts must be positive numbers and plates registered; several
+    payments for one plate are added up.
+    """
+    pd = _pandas()
+    df = df.assign(plate=df['plate'].str.upper())
+    amount = pd.to_numeric(df['amount'], errors='coerce')
+    accepted, rejected = _errors(df, [
+        (df['plate'] == '', "missing plate"),
+        (amount.isna(), "amount is not a number"),
+        (amount <= 0, "amount must be positive"),
+        (~df['plate'].isin(registered), "plate not registered"),
+    ])
+    totals = amount[accepted.index].groupby(accepted['plate']).sum()
+    return totals.to_dict(), rejected
+
+
+def import_vehicles(storage, path, update_existing=False, check_format=True, skip_invalid=False):
+    """Validate `path` and upsert the vehicles in one persist.
+
+    Returns (added, updated, rejected DataFrame). Nothing is written when
+    rows were rejected, unless `skip_invalid`.
+    """
+    registered = [v.plate for v in storage.vehicles()]
+    accepted, rejected = validate_vehicles(read_table(path, VEHICLE_FIELDS), registered, update_existing,
+                                           check_format)
+    if len(rejected) and not skip_invalid:
+        return 0, 0, rejected
+    records = list(accepted[VEHICLE_FIELDS].itertuples(index=False, name=None))
+    added, updated = storage.bulk_upsert_vehicles(records)
+    return added, updated, rejected
+
+
+def apply_topups(storage, path, skip_invalid=False):
+    """Validate a payments file (plate, amount) and credit all balances in one persist.
+
+    Returns ({plate: new balance}, rejected DataFrame), with the same
+    all-or-nothing rule as import_vehicles.
+    """
+    registered = [v.plate for v in storage.vehicles()]
+    totals, rejected = validate_topups(read_table(path, TOPUP_FIELDS), registered)
+    if (len(rejected) and not skip_invalid) or not totals:
+        return {}, rejected
+    return storage.bulk_top_up(totals), rejected
+
+
+def export_vehicles(storage, path):
+    """Write all vehicles to `path`. Returns the count.
+
+    CSV is written without pandas; Parquet/Arrow need pandas and pyarrow.
+    """
+    vehicles = storage.vehicles()
+    fmt = _format(path)
+    if fmt == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(VEHICLE_FIELDS)
+            writer.writerows((v.plate, v.owner, v.type, v.balance) for v in vehicles)
+        return len(vehicles)
+    pd = _pandas()
+    df = pd.DataFrame([v.as_dict() for v in vehicles], columns=VEHICLE_FIELDS)
+    if fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.to_feather(path)
+    return len(vehicles)
+
+
+def write_rejected(rejected, path):
+    rejected.reset_index().to_csv(path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk vehicle import/export and balance top-ups.")
+    parser.add_argument('--storage', choices=['csv', 'sqlite'], default=STORAGE_BACKEND)
+    parser.add_argument('--vehicles-db', default=VEHICLES_DB_FILE)
+    parser.add_argument('--toll-log', default=TOLL_LOG_FILE)
+    parser.add_argument('--db', default=SQLITE_DB_FILE)
+    sub = parser.add_subparsers(dest='command', required=True)
+    imp = sub.add_parser('import', help="Add vehicles from a CSV/Parquet/Arrow file")
+    imp.add_argument('file')
+    imp.add_argument('--update-existing', action='store_true', help="Replace vehicles that are already registered")
+    imp.add_argument('--no-format-check', action='store_true', help="Accept plates outside PLATE_GRAMMARS")
+    top = sub.add_parser('topup', help="Credit balances from a payments file with plate and amount columns")
+    top.add_argument('file')
+    for command in (imp, top):
+        command.add_argument('--skip-invalid', action='store_true',
+                             help="Apply the valid rows even if some were rejected")
+        command.add_argument('--errors', help="Write rejected rows with the reason to this CSV")
+    exp = sub.add_parser('export', help="Write all vehicles to a CSV/Parquet/Arrow file")
+    exp.add_argument('file')
+    args = parser.parse_args(argv)
+
+    storage = open_storage(args.storage, args.vehicles_db, args.toll_log, args.db)
+    try:
+        if args.command == 'export':
+            print(f"Exported {export_vehicles(storage, args.file)} vehicles to {args.file}")
+            return
+        if args.command == 'import':
+            added, updated, rejected = import_vehicles(storage, args.file, args.update_existing,
+                                                       not args.no_format_check, args.skip_invalid)
+            applied = added or updated
+            summary = f"{added} vehicles added, {updated} updated"
+        else:
+            balances, rejected = apply_topups(storage, args.file, args.skip_invalid)
+            applied = bool(balances)
+            summary = f"{len(balances)} balances topped up"
+    finally:
+        storage.close()
+
+    if len(rejected):
+        print(f"{len(rejected)} rows rejected:")
+        print(rejected.head(20).to_string())
+        if args.errors:
+            write_rejected(rejected, args.errors)
+            print(f"All rejected rows written to {args.errors}")
+        if not applied and not args.skip_invalid:
+            raise SystemExit("Nothing was changed (use --skip-invalid to apply the valid rows).")
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
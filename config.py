@@ -0,0 +1,113 @@
+# --- Configuration ---
+# Shared by the Tk app (main.py) and the headless tools so they always agree
+# on file locations and toll amounts.
+MODEL_PATH = 'yolov8_model/best.pt'
+CROPPED_DIR = 'cropped_objects_toll_system'
+VEHICLES_DB_FILE = 'vehicles_db.csv'  # Columns: plate, owner, type, balance
+TOLL_LOG_FILE = 'toll_log.csv'    # Columns: timestamp, plate, amount, status, image_ref
+DEFAULT_TOLL_AMOUNT = 10.00
+
+# Detector runtime: 'torch' runs best.pt directly; 'onnx' (ONNX Runtime) and
+# 'openvino' export it once to yolov8_model/ and run the exported model,
+# which is much faster on CPU-only booth PCs. Re-exported when best.pt changes.
+DETECTOR_BACKEND = 'torch'
+
+VEHICLE_FIELDS = ['plate', 'owner', 'type', 'balance']
+TOLL_LOG_FIELDS = ['timestamp', 'plate', 'amount', 'status', 'image_ref']
+
+# Plate crops are only written to CROPPED_DIR when SAVE_EVIDENCE is on. Old
+# files are evicted by count and age, never by wiping the directory.
+SAVE_EVIDENCE = False
+EVIDENCE_QUEUE_SIZE = 64
+EVIDENCE_MAX_FILES = 5000
+EVIDENCE_MAX_AGE_DAYS = 30
+
+# Toll log: 0 = fsync every row; > 0 = group-commit rows every N seconds.
+# Rotation to toll_log.<timestamp>.csv by size (0 = never) and/or by date.
+TOLL_LOG_COMMIT_INTERVAL = 0.0
+TOLL_LOG_MAX_BYTES = 0
+TOLL_LOG_ROTATE_DAILY = False
+
+# Storage backend: 'csv' (vehicles_db.csv + toll_log.csv) or 'sqlite'
+# (one WAL-mode database; import the CSVs with `python storage.py import`).
+STORAGE_BACKEND = 'csv'
+SQLITE_DB_FILE = 'toll_system.db'
+
+# Video streams: frames analysed per second, and the mean pixel change a
+# sampled frame needs before it is sent to the detector (0 = no motion gate).
+STREAM_SAMPLE_FPS = 5.0
+STREAM_MOTION_THRESHOLD = 0.0
+
+# Repeat reads of a plate (or one within DEDUP_MAX_DISTANCE edits of it,
+# unless that reading is itself registered) within DEDUP_TTL_SECONDS reuse
+# the first toll decision and are logged as "Duplicate". 0 disables.
+DEDUP_TTL_SECONDS = 60
+DEDUP_MAX_ENTRIES = 1024
+DEDUP_MAX_DISTANCE = 1
+
+# GUI processing pipeline: jobs each stage queue holds before pushing back,
+# and how many waiting images the detector may take in one call.
+PIPELINE_QUEUE_SIZE = 8
+PIPELINE_DETECT_BATCH_SIZE = 4
+PIPELINE_POLL_MS = 100 # How often the Tk loop collects finished jobs
+
+# Metrics: serve Prometheus text on http://127.0.0.1:<port>/metrics (0 = off)
+# and/or write a JSON snapshot to METRICS_JSON_FILE on exit (None = off).
+METRICS_PORT = 0
+METRICS_JSON_FILE = None
+
+# Shared recognition server (inference_server.py). When INFERENCE_SERVER_URL
+# is set ("http://127.0.0.1:8765" or "unix:///run/toll/recognizer.sock") the
+# app sends images there instead of loading its own copy of the models.
+INFERENCE_SERVER_URL = None
+INFERENCE_SERVER_PORT = 8765
+
+# Pre-OCR gating: boxes below OCR_MIN_CONFIDENCE, smaller than
+# OCR_MIN_BOX_SIZE (width, height in pixels), outside the plate aspect ratio
+# (width / height) range or of a class not in PLATE_CLASS_IDS (None = any)
+# are never sent to EasyOCR.
+OCR_MIN_CONFIDENCE = 0.25
+OCR_MIN_BOX_SIZE = (40, 12)
+PLATE_ASPECT_RANGE = (1.0, 8.0)
+PLATE_CLASS_IDS = None
+
+# Crops that pass are resized to OCR_PLATE_HEIGHT pixels high (0 = keep
+# size), converted to grayscale and, if OCR_DESKEW, rotated level.
+OCR_PLATE_HEIGHT = 64
+OCR_DESKEW = True
+
+# Plate text (plate_text.py). Grammars use [A-Z] / [0-9] with quantifiers;
+# region words are dropped from what EasyOCR reads; confusion pairs are
+# (letter, digit) look-alikes swapped where a grammar expects the other.
+PLATE_GRAMMARS = [
+    r'[A-Z]{2}[0-9]{1,2}[A-Z]{1,3}[0-9]{4}',  # India, e.g. MH20EE7777
+    r'[A-Z]{2,3}[0-9]{2,4}',                  # Pakistan, e.g. ACD531 (ICT), LEA1234
+]
+PLATE_REGION_WORDS = ['ISLAMABAD', 'ICT', 'PUNJAB', 'SINDH', 'LAHORE', 'KARACHI', 'KPK', 'BALOCHISTAN',
+                      'PAKISTAN', 'GOVT', 'INDIA', 'IND']
+PLATE_CONFUSIONS = [('O', '0'), ('I', '1'), ('B', '8'), ('S', '5'), ('Z', '2'), ('G', '6')]
+
+# Vehicle and toll log tables show this many rows per page; only the page
+# on screen exists as Treeview items.
+VIEW_PAGE_SIZE = 500
+
+# Tiled detection for high-resolution overview cameras: images whose longer
+# side exceeds DETECT_TILE_MIN_SIZE are also cut into DETECT_TILE_SIZE
+# tiles overlapping by DETECT_TILE_OVERLAP (a fraction), all run through
+# the detector in one batch together with the whole image, and the boxes
+# merged with NMS. 0 disables tiling.
+DETECT_TILE_SIZE = 0
+DETECT_TILE_OVERLAP = 0.2
+DETECT_TILE_MIN_SIZE = 1920
+DETECT_TILE_NMS_IOU = 0.5
+
+# Multi-lane settlement (settlement.py): plate events from all lanes go
+# through one writer that persists up to SETTLEMENT_BATCH_SIZE of them at a
+# time, waiting at most SETTLEMENT_MAX_DELAY seconds for a batch to fill
+# (0: batch only the events that queued up during the previous write, so a
+# lone lane never waits).
+# Event ids already settled are remembered (the last SETTLEMENT_EVENT_MEMORY
+# with CSV storage; all of them in the SQLite database) and never charged twice.
+SETTLEMENT_BATCH_SIZE = 64
+SETTLEMENT_MAX_DELAY = 0.0
+SETTLEMENT_EVENT_MEMORY = 100000
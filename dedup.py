@@ -0,0 +1,111 @@
+"""Short-lived cache of toll decisions, so one vehicle is not charged twice.
+
+A car is often captured in several consecutive images (or twice in one
+image). Within the TTL a repeat read of the same plate, or one within a
+small edit distance of it (OCR noise such as a dropped or swapped
+character), returns the earlier decision instead of charging again. A
+reading that is itself a registered plate is only matched exactly, so a
+different car with a similar plate is still charged.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from config import DEDUP_TTL_SECONDS, DEDUP_MAX_ENTRIES, DEDUP_MAX_DISTANCE
+
+
+def normalize_plate(plate):
+    return "".join(ch for ch in plate if ch.isalnum()).upper()
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance between a and b, or limit + 1 once it is known to exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class RecognitionCache:
+    """LRU map of normalized plate -> toll result, with per-entry expiry.
+
+    `ttl` <= 0 disables the cache. At most `max_entries` plates are kept;
+    the least recently seen is evicted first.
+    """
+
+    def __init__(self, ttl=DEDUP_TTL_SECONDS, max_entries=DEDUP_MAX_ENTRIES, max_distance=DEDUP_MAX_DISTANCE,
+                 clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.clock = clock
+        self._entries = OrderedDict() # plate -> (expires_at, result)
+        self._lock = threading.Lock()
+
+    def _purge_expired(self, now):
+        # Entries are kept in last-seen order and all share one TTL, so the
+        # expired ones are always at the front.
+        while self._entries:
+            plate, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[plate]
+
+    def get(self, plate, registered=None):
+        """Return the cached result for `plate` or a near-duplicate of it, or None.
+
+        `registered(plate)` tells whether a reading is a registered plate;
+        near-duplicates are only looked for when it is not.
+        """
+        if self.ttl <= 0:
+            return None
+        key = normalize_plate(plate)
+        with self._lock:
+            now = self.clock()
+            self._purge_expired(now)
+            match = key if key in self._entries else None
+            if match is None and self.max_distance > 0 and not (registered and registered(plate)):
+                for cached in self._entries:
+                    if edit_distance(key, cached, self.max_distance) <= self.max_distance:
+                        match = cached
+                        break
+            if match is None:
+                return None
+            # Seeing the car again keeps it in the window
+            _, result = self._entries.pop(match)
+            self._entries[match] = (now + self.ttl, result)
+            return result
+
+    def put(self, plate, result):
+        if self.ttl <= 0:
+            return
+        key = normalize_plate(plate)
+        with self._lock:
+            now = self.clock()
+            self._entries.pop(key, None)
+            self._entries[key] = (now + self.ttl, result)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def reserve(self, plate):
+        """Enter `plate` before its toll decision is known, so repeat reads already match it.
+
+        Returns the empty result dict to fill in once the decision is made,
+        or None when the cache is off.
+        """
+        if self.ttl <= 0:
+            return None
+        result = {}
+        self.put(plate, result)
+        return result
+
+    def discard(self, plate):
+        with self._lock:
+            self._entries.pop(normalize_plate(plate), None)
@@ -0,0 +1,104 @@
+"""Asynchronous evidence writer for plate crops.
+
+Crops are encoded and written on a background thread so disk I/O never sits
+on the recognition path. Old evidence is evicted by count and age instead of
+wiping the directory, so the `image_ref` recorded in the toll log keeps
+pointing at a real file for the whole retention period.
+"""
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from config import CROPPED_DIR, EVIDENCE_QUEUE_SIZE, EVIDENCE_MAX_FILES, EVIDENCE_MAX_AGE_DAYS
+from metrics import METRICS
+
+
+def evidence_name(prefix, source_name, index):
+    """A crop file name that is never reused.
+
+    The same source name comes back when a file is processed again, when
+    files in different folders share a name and when a stream restarts its
+    track ids, so the capture time and a random suffix are part of the name.
+    """
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    return f"{prefix}_{os.path.basename(str(source_name))}_{index}_{stamp}_{uuid.uuid4().hex[:6]}.jpg"
+
+
+class EvidenceWriter:
+    """Writes crops to `directory` from a bounded queue.
+
+    If the queue is full the crop is dropped (and counted in `dropped`)
+    rather than blocking the caller: evidence is best effort, toll processing
+    is not. Every `evict_every` writes the directory is trimmed to
+    `max_files` and files older than `max_age_days` are removed.
+    """
+
+    def __init__(self, directory=CROPPED_DIR, max_queue=EVIDENCE_QUEUE_SIZE, max_files=EVIDENCE_MAX_FILES,
+                 max_age_days=EVIDENCE_MAX_AGE_DAYS, evict_every=100):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_age_days = max_age_days
+        self.evict_every = evict_every
+        self.dropped = 0
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._queue = queue.Queue(maxsize=max_queue)
+        METRICS.gauge('queue_depth', self._queue.qsize, {'queue': 'evidence'})
+        self._thread = threading.Thread(target=self._run, name="evidence-writer", daemon=True)
+        self._thread.start()
+
+    def path_for(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def save(self, filename, image):
+        """Queue `image` to be written as `filename`. Returns the target path."""
+        path = self.path_for(filename)
+        try:
+            # Copy: the crop is usually a view into a frame that gets reused
+            self._queue.put_nowait((path, image.copy()))
+        except queue.Full:
+            self.dropped += 1
+            METRICS.inc('evidence_dropped_total')
+            print(f"Warning: evidence queue full, dropped {filename}")
+        return path
+
+    def close(self):
+        """Write everything still queued, then stop the thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, image = item
+            import cv2 # Deferred so the app starts without loading OpenCV
+            try:
+                with METRICS.time('evidence_write'):
+                    cv2.imwrite(path, image)
+            except Exception as e:
+                print(f"Error writing evidence {path}: {e}")
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self.evict()
+
+    def evict(self):
+        """Remove evidence beyond the retention limits, oldest first."""
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.is_file()]
+        except FileNotFoundError:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        cutoff = time.time() - self.max_age_days * 86400
+        excess = len(entries) - self.max_files
+        for i, entry in enumerate(entries):
+            if i >= excess and entry.stat().st_mtime >= cutoff:
+                break
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass # Another process evicted it first
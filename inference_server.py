@@ -0,0 +1,212 @@
+"""Local recognition service shared by several lanes.
+
+Loads YOLO and EasyOCR once and answers recognition requests over HTTP on
+localhost or on a Unix socket. Concurrent requests are coalesced into
+dynamic detector batches (see BatchDetector), so several lanes on one host
+share one copy of the models and get better throughput together than they
+would one image at a time.
+
+    python inference_server.py --port 8765 --batch-size 8 --max-latency-ms 20
+    python inference_server.py --unix-socket /run/toll/recognizer.sock
+
+API:
+    POST /recognize?name=<file name>   body: encoded image (JPEG/PNG bytes)
+        -> {"detected": bool, "plates": [{"raw_plate", "image_ref", "box",
+                                           "confidence", "class_id"}, ...]}
+    GET /health                        -> {"state": "ready"}
+    GET /metrics                       -> Prometheus text
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import socketserver
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import MODEL_PATH, DETECTOR_BACKEND, CROPPED_DIR, INFERENCE_SERVER_PORT
+from metrics import METRICS
+
+
+class RecognitionService:
+    """Decodes images, batches detection across callers and OCRs the plates."""
+
+    def __init__(self, model, reader, max_batch_size=8, max_latency=0.02, evidence_writer=None):
+        from recognition import BatchDetector
+        self.reader = reader
+        self.evidence_writer = evidence_writer
+        self.detector = BatchDetector(model, max_batch_size, max_latency)
+        # EasyOCR readers are not safe to call from several threads at once
+        self._ocr_lock = threading.Lock()
+
+    def recognize(self, image_bytes, source_name):
+        import cv2
+        import numpy as np
+        from recognition import recognize_plates
+
+        with METRICS.time('decode'):
+            image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Could not decode image.")
+        detections = self.detector.detect(image)
+        with self._ocr_lock:
+            detected_texts = recognize_plates(None, self.reader, image, source_name, self.evidence_writer,
+                                              detections=detections)
+        return {'detected': detected_texts is not None, 'plates': detected_texts or []}
+
+    def close(self):
+        self.detector.close()
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, {'state': 'ready'})
+            elif self.path == '/metrics':
+                body = METRICS.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            url = urllib.parse.urlsplit(self.path)
+            if url.path != '/recognize':
+                self.send_error(404)
+                return
+            name = urllib.parse.parse_qs(url.query).get('name', ['upload.jpg'])[0]
+            image_bytes = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                self._send_json(200, service.recognize(image_bytes, name))
+            except ValueError as e:
+                self._send_json(400, {'error': str(e)})
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            pass # One line per image would drown the console
+
+        def address_string(self):
+            return str(self.client_address or 'unix')
+
+    return Handler
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('unix', 0) # BaseHTTPRequestHandler expects a (host, port) pair
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class RecognitionClient:
+    """Thin client for the service: same return value as recognition.recognize_plates.
+
+    `url` is "http://host:port" or "unix:///path/to.sock".
+    """
+
+    def __init__(self, url, timeout=60):
+        self.url = url
+        self.timeout = timeout
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme == 'unix':
+            self._connect = lambda: _UnixHTTPConnection(parsed.path, timeout)
+        else:
+            self._connect = lambda: http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+
+    def _request(self, method, path, body=None):
+        conn = self._connect()
+        try:
+            conn.request(method, path, body=body, headers={'Content-Type': 'application/octet-stream'})
+            response = conn.getresponse()
+            payload = json.loads(response.read().decode('utf-8'))
+        finally:
+            conn.close()
+        if response.status != 200:
+            raise RuntimeError(f"Recognition server error: {payload.get('error', response.status)}")
+        return payload
+
+    def health(self):
+        return self._request('GET', '/health')
+
+    def recognize_bytes(self, image_bytes, source_name):
+        """Returns a list of plate dicts, or None when nothing was detected."""
+        query = urllib.parse.urlencode({'name': os.path.basename(source_name)})
+        payload = self._request('POST', f"/recognize?{query}", image_bytes)
+        return payload['plates'] if payload['detected'] else None
+
+    def recognize_file(self, filepath):
+        with open(filepath, 'rb') as f:
+            return self.recognize_bytes(f.read(), filepath)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve plate recognition to local clients.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=INFERENCE_SERVER_PORT)
+    parser.add_argument('--unix-socket', help="Listen on this Unix socket instead of TCP")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--backend', choices=['torch', 'onnx', 'openvino'], default=DETECTOR_BACKEND,
+                        help="Detector runtime")
+    parser.add_argument('--batch-size', type=int, default=8, help="Largest detector batch")
+    parser.add_argument('--max-latency-ms', type=float, default=20,
+                        help="Longest a request waits for others to join its batch")
+    parser.add_argument('--save-evidence', action='store_true')
+    args = parser.parse_args(argv)
+
+    from evidence import EvidenceWriter
+    from recognition import ModelLoader
+
+    model, reader = ModelLoader(args.model, backend=args.backend).start().wait()
+    evidence_writer = EvidenceWriter(CROPPED_DIR) if args.save_evidence else None
+    service = RecognitionService(model, reader, args.batch_size, args.max_latency_ms / 1000, evidence_writer)
+    handler = make_handler(service)
+
+    if args.unix_socket:
+        if os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+        server = ThreadingUnixHTTPServer(args.unix_socket, handler)
+        where = f"unix://{args.unix_socket}"
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), handler)
+        where = f"http://{args.host}:{args.port}"
+    print(f"Recognition server listening on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if evidence_writer:
+            evidence_writer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,31 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import csv
-import cv2
 import os
-import easyocr
-# from ultralytics import YOLO # Keep this if you have it set up
+import queue
 from datetime import datetime
-import shutil # For cleaning up cropped images
-
-from ultralytics import YOLO
-# --- Configuration ---
-MODEL_PATH = 'yolov8_model/best.pt'  
-CROPPED_DIR = 'cropped_objects_toll_system'
-VEHICLES_DB_FILE = 'vehicles_db.csv'  # Columns: plate, owner, type, balance
-TOLL_LOG_FILE = 'toll_log.csv'    # Columns: timestamp, plate, amount, status, image_ref
-DEFAULT_TOLL_AMOUNT = 10.00
-
-# --- Initialize OCR and Object Detection ---
-# Ensure 'best.pt' is in the same directory or provide the full path
-# For demonstration, if YOLO causes issues without GPU or setup, we can mock it.
-try:
-    model = YOLO(MODEL_PATH)
-    yolo_available = True
-    print("YOLO model loaded successfully.")
-except Exception as e:
-    print(f"Error loading YOLO model: {e}. YOLO features will be disabled.")
-    yolo_available = False
-    model = None # Placeholder
-
-try:
-    reader = easyocr.Reader(['en'])
-    ocr_available = True
-    print("EasyOCR reader initialized.")
-except Exception as e:
-    print(f"Error initializing EasyOCR: {e}. OCR features will be disabled.")
-    ocr_available = False
-    reader = None # Placeholder
+
+# Only light modules are imported here. OpenCV, EasyOCR and ultralytics/torch
+# are imported on first use (mostly by the background ModelLoader) so the
+# window appears immediately and the vehicle/log tabs are usable while the
+# models load.
+from config import (MODEL_PATH, CROPPED_DIR, VEHICLES_DB_FILE, TOLL_LOG_FILE,
+                    DEFAULT_TOLL_AMOUNT, SAVE_EVIDENCE, STORAGE_BACKEND, SQLITE_DB_FILE, PIPELINE_POLL_MS,
+                    METRICS_PORT, METRICS_JSON_FILE, INFERENCE_SERVER_URL)
+import bulk
+from evidence import EvidenceWriter
+from inference_server import RecognitionClient
+from metrics import METRICS, start_http_server
+from pipeline import RecognitionPipeline
+from dedup import RecognitionCache
+from recognition import ModelLoader
+from storage import open_storage
+from settlement import SettlementEngine
+from toll_log import LogIndex
+from views import PagedView
+
+MODEL_POLL_MS = 200
+BULK_FILE_TYPES = (("CSV files", "*.csv"), ("Parquet files", "*.parquet"), ("Arrow files", "*.arrow *.feather"),
+                   ("All files", "*.*"))
 
 class TollManagementApp:
     def __init__(self, root):
@@ -43,11 +33,13 @@ class TollManagementApp:
         self.root.title("Advanced Toll Management System")
         self.root.geometry("900x700")
 
-        # Initialize data storage if files don't exist
-        self._init_csv_files()
-
-        self.vehicles_data = self._load_data(VEHICLES_DB_FILE)
-        self.toll_log_data = self._load_data(TOLL_LOG_FILE)
+        # Open the vehicle/log storage (CSV files are created if they don't exist)
+        self.storage = self._open_storage()
+        self.toll_log_reader = self.storage.log_reader()
+        self.toll_log_index = LogIndex()
+        self.toll_log_filter = {}
+        # The pipeline and manual entry settle through one writer thread
+        self.toll_processor = SettlementEngine(self.storage, DEFAULT_TOLL_AMOUNT, cache=RecognitionCache())
 
         # Styling
         style = ttk.Style()
@@ -77,50 +69,51 @@ class TollManagementApp:
 
         self.notebook.pack(expand=True, fill='both')
 
-        # Periodically clean up old cropped images
-        self._cleanup_cropped_dir()
-
-
-    def _init_csv_files(self):
-        if not os.path.exists(VEHICLES_DB_FILE):
-            with open(VEHICLES_DB_FILE, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(['plate', 'owner', 'type', 'balance'])
-                # Add a sample vehicle for testing
-                writer.writerow(['MH20EE7777', 'Test User', 'Car', '50.00'])
-        if not os.path.exists(TOLL_LOG_FILE):
-            with open(TOLL_LOG_FILE, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(['timestamp', 'plate', 'amount', 'status', 'image_ref'])
-
-    def _load_data(self, filename):
-        data = []
-        try:
-            with open(filename, 'r', newline='', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    data.append(row)
-        except FileNotFoundError:
-            messagebox.showerror("Error", f"{filename} not found. Please ensure it exists.")
-        return data
-
-    def _save_data(self, filename, data, fieldnames):
+        # Plate crops are kept only if evidence saving is on; the writer
+        # evicts old files itself, so nothing here deletes the directory.
+        self.evidence_writer = EvidenceWriter(CROPPED_DIR) if SAVE_EVIDENCE else None
+        # The pipeline is created once the models are loaded (see _poll_models)
+        self.pipeline = None
+        if INFERENCE_SERVER_URL:
+            # Thin client: the shared recognition server holds the models
+            self.models = None
+            self.pipeline = RecognitionPipeline(None, None, self.toll_processor,
+                                                client=RecognitionClient(INFERENCE_SERVER_URL))
+            self.model_status_label.config(text=f"Models: server {INFERENCE_SERVER_URL}", foreground="green")
+            self.root.after(PIPELINE_POLL_MS, self._poll_pipeline)
+        else:
+            self.models = ModelLoader(MODEL_PATH).start()
+            self.root.after(MODEL_POLL_MS, self._poll_models)
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+
+        if METRICS_PORT:
+            start_http_server(METRICS_PORT)
+            print(f"Metrics available at http://127.0.0.1:{METRICS_PORT}/metrics")
+
+    def _on_close(self):
+        if self.pipeline:
+            pending = self.pipeline.pending()
+            if pending:
+                self.status_bar.config(text=f"Status: Finishing {pending} queued image(s) before closing...")
+                self.root.update_idletasks()
+            self.pipeline.close() # Let images already queued finish and settle before the engine stops
+        if METRICS_JSON_FILE:
+            METRICS.dump_json(METRICS_JSON_FILE)
+        if self.evidence_writer:
+            self.evidence_writer.close() # Flush pending evidence images
+        self.toll_processor.close() # Settle events still queued
+        self.storage.close() # Commits any group-commit log rows still buffered
+        self.root.destroy()
+
+
+    def _open_storage(self):
         try:
-            with open(filename, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(data)
+            # Save errors are raised, not shown here: settlement runs off the
+            # Tk thread and reports them through job.error
+            return open_storage(STORAGE_BACKEND, VEHICLES_DB_FILE, TOLL_LOG_FILE, SQLITE_DB_FILE)
         except Exception as e:
-            messagebox.showerror("Save Error", f"Could not save data to {filename}: {e}")
-
-    def _cleanup_cropped_dir(self):
-        if os.path.exists(CROPPED_DIR):
-            try:
-                shutil.rmtree(CROPPED_DIR) # Removes the directory and all its contents
-                print(f"Cleaned up {CROPPED_DIR}")
-            except Exception as e:
-                print(f"Error cleaning up {CROPPED_DIR}: {e}")
-        os.makedirs(CROPPED_DIR, exist_ok=True)
+            messagebox.showerror("Error", f"Could not open {STORAGE_BACKEND} storage: {e}")
+            raise
 
 
     # --- TAB 1: Process Toll ---
@@ -134,6 +127,8 @@ class TollManagementApp:
         ttk.Button(top_frame, text="Select Image & Process", command=self.select_and_process_image).pack(side=tk.LEFT, padx=5)
         self.image_path_label = ttk.Label(top_frame, text="No image selected")
         self.image_path_label.pack(side=tk.LEFT, padx=5)
+        self.model_status_label = ttk.Label(top_frame, text="Models: loading...", foreground="orange")
+        self.model_status_label.pack(side=tk.RIGHT, padx=5)
 
         # Frame for displaying detected plates and actions
         results_frame = ttk.LabelFrame(frame, text="Detected Plates & Toll Processing", padding=10)
@@ -158,142 +153,99 @@ class TollManagementApp:
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
 
 
+    def _poll_models(self):
+        if self.models.state == "loading":
+            self.root.after(MODEL_POLL_MS, self._poll_models)
+            return
+        if self.models.ready:
+            self.pipeline = RecognitionPipeline(self.models.model, self.models.reader, self.toll_processor,
+                                                self.evidence_writer)
+            self.root.after(PIPELINE_POLL_MS, self._poll_pipeline)
+            self.model_status_label.config(text="Models: ready", foreground="green")
+        else:
+            self.model_status_label.config(text="Models: unavailable", foreground="red")
+
     def select_and_process_image(self):
-        if not yolo_available or not ocr_available:
-            messagebox.showerror("Dependency Error", "YOLO model or EasyOCR is not available. Cannot process image.")
+        if self.models is not None and self.models.state != "loading" and not self.models.ready:
+            messagebox.showerror("Dependency Error", f"YOLO model or EasyOCR is not available. Cannot process image.\n\n{self.models.error}")
+            return
+        if self.pipeline is None:
+            # Still loading, or loaded but not yet picked up by _poll_models
+            messagebox.showinfo("Please Wait", "The YOLO model and EasyOCR are still loading. Try again in a moment.")
             return
 
-        filepath = filedialog.askopenfilename(
-            title="Select Image",
+        filepaths = filedialog.askopenfilenames(
+            title="Select Image(s)",
             filetypes=(("JPEG files", "*.jpg"), ("PNG files", "*.png"), ("All files", "*.*"))
         )
-        if not filepath:
+        if not filepaths:
             return
 
-        self.image_path_label.config(text=os.path.basename(filepath))
-        self.status_bar.config(text="Status: Processing image...")
-        self.root.update_idletasks() # Force GUI update
-
+        # Clear previous results
+        for item in self.detected_plates_tree.get_children():
+            self.detected_plates_tree.delete(item)
+
+        # Recognition runs on the pipeline threads; results come back through
+        # _poll_pipeline, so the window stays responsive and more images can
+        # be queued while these are still being read.
+        queued = 0
+        for filepath in filepaths:
+            if self.pipeline.submit(filepath) is None:
+                messagebox.showwarning("Busy", f"Processing queue is full, {len(filepaths) - queued} image(s) "
+                                               "were not queued. Please try again shortly.")
+                break
+            queued += 1
+        if queued:
+            self.image_path_label.config(text=", ".join(os.path.basename(p) for p in filepaths[:queued]))
+            self.status_bar.config(text=f"Status: Processing {self.pipeline.pending()} image(s)...")
+
+    def _poll_pipeline(self):
         try:
-            image = cv2.imread(filepath)
-            if image is None:
-                messagebox.showerror("Error", "Could not read image file.")
-                self.status_bar.config(text="Status: Error reading image.")
-                return
+            while True:
+                self._show_job_result(self.pipeline.results.get_nowait())
+        except queue.Empty:
+            pass
+        self.root.after(PIPELINE_POLL_MS, self._poll_pipeline)
+
+    def _show_job_result(self, job):
+        name = os.path.basename(job.filepath)
+        if job.error:
+            messagebox.showerror("Processing Error", f"{name}: {job.error}")
+            self.status_bar.config(text=f"Status: Error - {job.error}")
+            return
+        if job.detected_texts is None:
+            self.status_bar.config(text=f"Status: No objects detected by YOLO in {name}.")
+            return # No detections
+        if not job.detected_texts:
+            self.status_bar.config(text=f"Status: No license plates read by OCR in {name}.")
+            messagebox.showinfo("OCR Result", f"No license plates could be read from the detected objects in {name}.")
+            return
 
-            # Clear previous results
-            for item in self.detected_plates_tree.get_children():
-                self.detected_plates_tree.delete(item)
-            self._cleanup_cropped_dir() # Clean before new processing
-
-            results = model(image) # YOLO detection
-            # The structure of 'results' might vary slightly based on ultralytics version
-            # Assuming results[0].boxes gives access to bounding boxes
-
-            detected_texts = []
-            if results and results[0].boxes is not None:
-                boxes = results[0].boxes.xyxy.cpu().numpy() # Get boxes in xyxy format
-                confidences = results[0].boxes.conf.cpu().numpy() # Get confidences
-                class_ids = results[0].boxes.cls.cpu().numpy() # Get class IDs
-
-                for i, (box, conf, cls_id) in enumerate(zip(boxes, confidences, class_ids)):
-                    # Assuming class 0 is 'license_plate' or similar in your 'best.pt'
-                    # You might need to adjust this if your model has multiple classes
-                    # For now, let's assume all detected objects are plates if you only trained for plates
-                    x_min, y_min, x_max, y_max = map(int, box)
-                    cropped_object = image[y_min:y_max, x_min:x_max]
-                    
-                    # Sanity check for cropped image size
-                    if cropped_object.size == 0:
-                        print(f"Warning: Cropped object {i} is empty. Skipping.")
-                        continue
-
-                    cropped_image_path = os.path.join(CROPPED_DIR, f"cropped_{os.path.basename(filepath)}_{i}.jpg")
-                    cv2.imwrite(cropped_image_path, cropped_object)
-                    
-                    ocr_result = reader.readtext(cropped_image_path, detail=0, paragraph=False) # Simpler output
-                    
-                    # Combine OCR results, filter for alphanumeric, and make uppercase
-                    # Basic filtering for common OCR errors could be added here
-                    plate_text = "".join(filter(str.isalnum, "".join(ocr_result))).upper()
-                    
-                    if plate_text: # Only process if OCR found something
-                        detected_texts.append({'raw_plate': plate_text, 'image_ref': cropped_image_path})
-            else:
-                self.status_bar.config(text="Status: No objects detected by YOLO.")
-                return # No detections
-
-            if not detected_texts:
-                self.status_bar.config(text="Status: No license plates read by OCR.")
-                messagebox.showinfo("OCR Result", "No license plates could be read from the detected objects.")
-                return
+        for result in job.toll_results:
+            self._show_toll_result(result)
 
-            # Process detected plates for toll
-            for det_plate_info in detected_texts:
-                plate = det_plate_info['raw_plate']
-                image_ref = det_plate_info['image_ref']
-                self._process_toll_for_plate(plate, image_ref)
+        pending = self.pipeline.pending()
+        status = f"Status: {name} complete. {len(job.detected_texts)} potential plates found."
+        if pending:
+            status += f" {pending} image(s) still queued."
+        self.status_bar.config(text=status)
+        self._refresh_toll_log_tab() # Update log tab as well
 
-            self.status_bar.config(text=f"Status: Processing complete. {len(detected_texts)} potential plates found.")
-            self._refresh_toll_log_tab() # Update log tab as well
 
-        except Exception as e:
-            messagebox.showerror("Processing Error", f"An error occurred: {e}")
-            self.status_bar.config(text=f"Status: Error - {e}")
-            import traceback
-            traceback.print_exc()
-
-
-    def _process_toll_for_plate(self, plate_number, image_ref):
-        vehicle = self._find_vehicle(plate_number)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        status = "Unknown"
-        owner = "N/A"
-        balance_val = "N/A"
-
-        if vehicle:
-            owner = vehicle['owner']
-            try:
-                current_balance = float(vehicle['balance'])
-                balance_val = f"{current_balance:.2f}"
-                if current_balance >= DEFAULT_TOLL_AMOUNT:
-                    vehicle['balance'] = str(current_balance - DEFAULT_TOLL_AMOUNT)
-                    status = "Auto-Paid"
-                    self._log_toll_transaction(timestamp, plate_number, DEFAULT_TOLL_AMOUNT, status, image_ref)
-                    self._save_data(VEHICLES_DB_FILE, self.vehicles_data, ['plate', 'owner', 'type', 'balance'])
-                    self._refresh_vehicle_management_tab() # Update vehicle data display
-                    balance_val = f"{float(vehicle['balance']):.2f} (Paid)"
-                else:
-                    status = "Unpaid - Low Balance"
-                    self._log_toll_transaction(timestamp, plate_number, DEFAULT_TOLL_AMOUNT, status, image_ref)
-            except ValueError:
-                status = "Error - Invalid Balance"
-                balance_val = vehicle['balance'] + " (Error)"
-                self._log_toll_transaction(timestamp, plate_number, DEFAULT_TOLL_AMOUNT, status, image_ref)
-        else:
-            status = "Unpaid - Unregistered"
-            self._log_toll_transaction(timestamp, plate_number, DEFAULT_TOLL_AMOUNT, status, image_ref)
+    def _show_toll_result(self, result):
+        status = result['status']
+        if result['duplicate']:
+            status += " (Duplicate)" # Already charged moments ago, logged as a duplicate only
+        elif status == "Auto-Paid":
+            self._show_vehicle(result['plate']) # Patch just the charged vehicle's row
 
         # Add to the detected plates treeview
-        self.detected_plates_tree.insert('', tk.END, values=(plate_number, status, owner, balance_val, "Details"))
+        self.detected_plates_tree.insert('', tk.END, values=(
+            result['plate'], status, result['owner'], result['balance'], "Details"))
         # Could add a button or double-click event here to show image_ref or more details
 
     def _find_vehicle(self, plate_number):
-        for v in self.vehicles_data:
-            if v['plate'] == plate_number:
-                return v
-        return None
-
-    def _log_toll_transaction(self, timestamp, plate, amount, status, image_ref):
-        new_log_entry = {
-            'timestamp': timestamp,
-            'plate': plate,
-            'amount': f"{amount:.2f}",
-            'status': status,
-            'image_ref': os.path.basename(image_ref) # Store only filename
-        }
-        self.toll_log_data.append(new_log_entry)
-        self._save_data(TOLL_LOG_FILE, self.toll_log_data, ['timestamp', 'plate', 'amount', 'status', 'image_ref'])
+        return self.storage.find_vehicle(plate_number)
 
 
     # --- TAB 2: Vehicle Management ---
@@ -304,17 +256,19 @@ class TollManagementApp:
         list_frame = ttk.LabelFrame(frame, text="Registered Vehicles", padding=10)
         list_frame.pack(fill=tk.BOTH, expand=True, pady=5)
 
+        # Only the page on screen is in the Treeview; row values live in
+        # vehicle_rows (plate -> values) and are patched one plate at a time.
         cols = ('plate', 'owner', 'type', 'balance')
-        self.vehicles_tree = ttk.Treeview(list_frame, columns=cols, show='headings', height=10)
-        for col in cols:
-            self.vehicles_tree.heading(col, text=col.title())
-            self.vehicles_tree.column(col, width=150, anchor=tk.W)
-        self.vehicles_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-        vsb_vehicles = ttk.Scrollbar(list_frame, orient="vertical", command=self.vehicles_tree.yview)
-        vsb_vehicles.pack(side=tk.RIGHT, fill=tk.Y)
-        self.vehicles_tree.configure(yscrollcommand=vsb_vehicles.set)
-        
+        self.vehicle_rows = {}
+        self.vehicle_view = PagedView(list_frame, cols, self.vehicle_rows.__getitem__, height=10, width=150)
+        self.vehicles_tree = self.vehicle_view.tree
+        list_buttons = ttk.Frame(list_frame)
+        list_buttons.pack(fill=tk.X)
+        ttk.Button(list_buttons, text="Reload", command=self._refresh_vehicle_management_tab).pack(side=tk.RIGHT)
+        ttk.Button(list_buttons, text="Export...", command=self.export_vehicles_file).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(list_buttons, text="Top Up from File...", command=self.top_up_from_file).pack(side=tk.RIGHT)
+        ttk.Button(list_buttons, text="Import File...", command=self.import_vehicles_file).pack(side=tk.RIGHT, padx=5)
+
         self._refresh_vehicle_management_tab()
 
         # Add/Edit vehicle form
@@ -343,22 +297,41 @@ class TollManagementApp:
         ttk.Button(form_frame, text="Load Selected", command=self.load_selected_vehicle_to_form).grid(row=0, column=2, rowspan=2, padx=5, pady=5, sticky=tk.EW)
 
 
+    def _store_vehicle_change(self, change, *args):
+        try:
+            change(*args)
+            return True
+        except Exception as e:
+            messagebox.showerror("Save Error", f"Could not save vehicle data: {e}")
+            return False
+
+    def _vehicle_values(self, vehicle):
+        try:
+            balance_val = f"{float(vehicle.balance):.2f}"
+        except ValueError:
+            balance_val = vehicle.balance or 'N/A' # Show raw if not float
+        return (vehicle.plate, vehicle.owner, vehicle.type, balance_val)
+
     def _refresh_vehicle_management_tab(self):
-        # Clear existing items
-        for item in self.vehicles_tree.get_children():
-            self.vehicles_tree.delete(item)
-        # Add new items
-        for vehicle in self.vehicles_data:
-            try:
-                balance_val = f"{float(vehicle.get('balance', 0.0)):.2f}"
-            except ValueError:
-                balance_val = vehicle.get('balance', 'N/A') # Show raw if not float
-            self.vehicles_tree.insert('', tk.END, values=(
-                vehicle.get('plate', ''),
-                vehicle.get('owner', ''),
-                vehicle.get('type', ''),
-                balance_val
-            ))
+        # Full reload, e.g. to pick up changes made by another booth process
+        self.vehicle_rows.clear()
+        for vehicle in self.storage.vehicles():
+            self.vehicle_rows[vehicle.plate] = self._vehicle_values(vehicle)
+        self.vehicle_view.set_keys(self.vehicle_rows, page=self.vehicle_view.page)
+
+    def _show_vehicle(self, plate, previous_plate=None):
+        """Update the one row for `plate` (renamed from `previous_plate`) from storage."""
+        vehicle = self.storage.find_vehicle(plate)
+        if previous_plate is not None and previous_plate != plate:
+            del self.vehicle_rows[previous_plate]
+            self.vehicle_rows[plate] = self._vehicle_values(vehicle)
+            self.vehicle_view.replace(previous_plate, plate)
+        elif vehicle is None:
+            self.vehicle_rows.pop(plate, None)
+            self.vehicle_view.remove(plate)
+        else:
+            self.vehicle_rows[plate] = self._vehicle_values(vehicle)
+            self.vehicle_view.refresh(plate)
     
     def load_selected_vehicle_to_form(self):
         selected_item = self.vehicles_tree.focus()
@@ -399,10 +372,9 @@ class TollManagementApp:
             messagebox.showerror("Error", f"Vehicle with plate {plate} already exists.")
             return
 
-        new_vehicle = {'plate': plate, 'owner': owner, 'type': v_type, 'balance': f"{balance:.2f}"}
-        self.vehicles_data.append(new_vehicle)
-        self._save_data(VEHICLES_DB_FILE, self.vehicles_data, ['plate', 'owner', 'type', 'balance'])
-        self._refresh_vehicle_management_tab()
+        if not self._store_vehicle_change(self.storage.add_vehicle, plate, owner, v_type, f"{balance:.2f}"):
+            return
+        self._show_vehicle(plate)
         messagebox.showinfo("Success", f"Vehicle {plate} added.")
         # Clear entries
         self.plate_entry.delete(0, tk.END)
@@ -433,7 +405,7 @@ class TollManagementApp:
             messagebox.showerror("Input Error", "Balance must be a valid number for update.")
             return
 
-        # Find the vehicle in self.vehicles_data using the original plate from Treeview if plate is being changed
+        # Find the vehicle in storage using the original plate from Treeview if plate is being changed
         original_plate = self.vehicles_tree.item(selected_item, 'values')[0]
         vehicle_to_update = self._find_vehicle(original_plate)
 
@@ -446,13 +418,10 @@ class TollManagementApp:
             messagebox.showerror("Error", f"Another vehicle with plate {plate} already exists.")
             return
 
-        vehicle_to_update['plate'] = plate
-        vehicle_to_update['owner'] = owner
-        vehicle_to_update['type'] = v_type
-        vehicle_to_update['balance'] = f"{balance:.2f}"
-
-        self._save_data(VEHICLES_DB_FILE, self.vehicles_data, ['plate', 'owner', 'type', 'balance'])
-        self._refresh_vehicle_management_tab()
+        if not self._store_vehicle_change(self.storage.update_vehicle, original_plate, plate, owner, v_type,
+                                          f"{balance:.2f}"):
+            return
+        self._show_vehicle(plate, original_plate)
         messagebox.showinfo("Success", f"Vehicle {plate} updated.")
     
     def delete_vehicle(self):
@@ -464,12 +433,66 @@ class TollManagementApp:
         plate_to_delete = self.vehicles_tree.item(selected_item, 'values')[0]
         
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete vehicle {plate_to_delete}?"):
-            self.vehicles_data = [v for v in self.vehicles_data if v['plate'] != plate_to_delete]
-            self._save_data(VEHICLES_DB_FILE, self.vehicles_data, ['plate', 'owner', 'type', 'balance'])
-            self._refresh_vehicle_management_tab()
+            if not self._store_vehicle_change(self.storage.delete_vehicle, plate_to_delete):
+                return
+            self._show_vehicle(plate_to_delete)
             messagebox.showinfo("Success", f"Vehicle {plate_to_delete} deleted.")
 
 
+    def _confirm_partial(self, rejected, valid_what):
+        reasons = "\n".join(f"Line {line}: {row.plate} - {row.error}"
+                            for line, row in rejected.head(10).iterrows())
+        more = f"\n... and {len(rejected) - 10} more" if len(rejected) > 10 else ""
+        return messagebox.askyesno("Rejected Rows", f"{len(rejected)} rows were rejected:\n\n{reasons}{more}\n\n"
+                                   f"Apply the {valid_what} anyway?")
+
+    def import_vehicles_file(self):
+        path = filedialog.askopenfilename(title="Import Vehicles", filetypes=BULK_FILE_TYPES)
+        if not path:
+            return
+        try:
+            added, updated, rejected = bulk.import_vehicles(self.storage, path)
+            if len(rejected):
+                if not self._confirm_partial(rejected, "valid rows"):
+                    return
+                added, updated, rejected = bulk.import_vehicles(self.storage, path, skip_invalid=True)
+        except Exception as e:
+            messagebox.showerror("Import Error", f"Could not import {os.path.basename(path)}: {e}")
+            return
+        self._refresh_vehicle_management_tab()
+        messagebox.showinfo("Import Complete", f"{added} vehicles added, {updated} updated, "
+                            f"{len(rejected)} rows rejected.")
+
+    def top_up_from_file(self):
+        path = filedialog.askopenfilename(title="Top Up Balances (plate, amount)", filetypes=BULK_FILE_TYPES)
+        if not path:
+            return
+        try:
+            balances, rejected = bulk.apply_topups(self.storage, path)
+            if len(rejected):
+                if not self._confirm_partial(rejected, "valid payments"):
+                    return
+                balances, rejected = bulk.apply_topups(self.storage, path, skip_invalid=True)
+        except Exception as e:
+            messagebox.showerror("Top-Up Error", f"Could not apply {os.path.basename(path)}: {e}")
+            return
+        for plate in balances:
+            self._show_vehicle(plate)
+        messagebox.showinfo("Top-Up Complete", f"{len(balances)} balances topped up, {len(rejected)} rows rejected.")
+
+    def export_vehicles_file(self):
+        path = filedialog.asksaveasfilename(title="Export Vehicles", defaultextension=".csv",
+                                            filetypes=BULK_FILE_TYPES)
+        if not path:
+            return
+        try:
+            count = bulk.export_vehicles(self.storage, path)
+        except Exception as e:
+            messagebox.showerror("Export Error", f"Could not export to {os.path.basename(path)}: {e}")
+            return
+        messagebox.showinfo("Export Complete", f"{count} vehicles written to {os.path.basename(path)}.")
+
+
     # --- TAB 3: Toll Log ---
     def _create_toll_log_tab(self):
         frame = self.tab_toll_log
@@ -477,45 +500,74 @@ class TollManagementApp:
         log_frame = ttk.LabelFrame(frame, text="Toll Transaction Log", padding=10)
         log_frame.pack(fill=tk.BOTH, expand=True, pady=5)
 
+        # Filters are answered from the in-memory log index, never by
+        # rescanning the file
+        filter_frame = ttk.Frame(log_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(filter_frame, text="Plate:").pack(side=tk.LEFT)
+        self.log_plate_entry = ttk.Entry(filter_frame, width=14)
+        self.log_plate_entry.pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(filter_frame, text="Status:").pack(side=tk.LEFT)
+        self.log_status_combo = ttk.Combobox(filter_frame, width=22, state='readonly')
+        self.log_status_combo.pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(filter_frame, text="From:").pack(side=tk.LEFT)
+        self.log_from_entry = ttk.Entry(filter_frame, width=11)
+        self.log_from_entry.pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(filter_frame, text="To:").pack(side=tk.LEFT)
+        self.log_to_entry = ttk.Entry(filter_frame, width=11)
+        self.log_to_entry.pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Button(filter_frame, text="Filter", command=self.apply_toll_log_filter).pack(side=tk.LEFT)
+        ttk.Button(filter_frame, text="Clear", command=self.clear_toll_log_filter).pack(side=tk.LEFT, padx=5)
+
         cols = ('timestamp', 'plate', 'amount', 'status', 'image_ref')
-        self.toll_log_tree = ttk.Treeview(log_frame, columns=cols, show='headings', height=15)
-        for col in cols:
-            self.toll_log_tree.heading(col, text=col.replace('_',' ').title())
-            self.toll_log_tree.column(col, width=120, anchor=tk.W)
-        self.toll_log_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.toll_log_view = PagedView(log_frame, cols, lambda position: self.toll_log_index.rows[position],
+                                       height=15)
+        self.toll_log_tree = self.toll_log_view.tree
 
-        vsb_log = ttk.Scrollbar(log_frame, orient="vertical", command=self.toll_log_tree.yview)
-        vsb_log.pack(side=tk.RIGHT, fill=tk.Y)
-        self.toll_log_tree.configure(yscrollcommand=vsb_log.set)
-        
         self._refresh_toll_log_tab()
 
         ttk.Button(frame, text="Refresh Log", command=self._refresh_toll_log_tab).pack(pady=10)
-        # Future: Add filtering options here
 
     def _refresh_toll_log_tab(self):
-        # Clear existing items
-        for item in self.toll_log_tree.get_children():
-            self.toll_log_tree.delete(item)
-        # Reload data from file in case it was modified externally or by other parts of app
-        self.toll_log_data = self._load_data(TOLL_LOG_FILE)
-        # Add new items
-        for log_entry in self.toll_log_data:
-            self.toll_log_tree.insert('', tk.END, values=(
-                log_entry.get('timestamp', ''),
-                log_entry.get('plate', ''),
-                log_entry.get('amount', ''),
-                log_entry.get('status', ''),
-                log_entry.get('image_ref', '')
-            ))
+        # Tail the log: only rows appended since the last refresh are parsed
+        # and indexed. Writes from other processes show up here as well.
+        new_entries = self.toll_log_reader.read_new()
+        if self.toll_log_reader.reset: # Log was rotated, start over
+            self.toll_log_index.clear()
+            self.toll_log_view.set_keys([])
+        if not new_entries:
+            return
+        positions = self.toll_log_index.append(new_entries)
+        self.log_status_combo['values'] = [''] + self.toll_log_index.statuses()
+        self.toll_log_view.append([p for p in positions
+                                   if self.toll_log_index.matches(p, **self.toll_log_filter)])
+
+    def apply_toll_log_filter(self):
+        start_date = self.log_from_entry.get().strip()
+        end_date = self.log_to_entry.get().strip()
+        for value in (start_date, end_date):
+            if value:
+                try:
+                    datetime.strptime(value, "%Y-%m-%d")
+                except ValueError:
+                    messagebox.showerror("Input Error", "Dates must be in YYYY-MM-DD format.")
+                    return
+        self.toll_log_filter = {
+            'plate': self.log_plate_entry.get().strip(),
+            'status': self.log_status_combo.get(),
+            'start_date': start_date,
+            'end_date': end_date,
+        }
+        self.toll_log_view.set_keys(self.toll_log_index.query(**self.toll_log_filter), page=-1)
 
-if __name__ == "__main__":
-    if not yolo_available and not ocr_available:
-        print("CRITICAL ERROR: Neither YOLO nor EasyOCR could be initialized.")
-        print("The application might not function correctly or at all.")
-        # Optionally, exit or show a critical error GUI message here
-        # For now, we'll let it run to show the GUI structure.
+    def clear_toll_log_filter(self):
+        for entry in (self.log_plate_entry, self.log_from_entry, self.log_to_entry):
+            entry.delete(0, tk.END)
+        self.log_status_combo.set('')
+        self.toll_log_filter = {}
+        self.toll_log_view.set_keys(range(len(self.toll_log_index)), page=-1)
 
+if __name__ == "__main__":
     root = tk.Tk()
     app = TollManagementApp(root)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,185 @@
+"""Per-stage latency and counters for the recognition and toll pipeline.
+
+Everything records into the module-level METRICS registry:
+
+    with METRICS.time('ocr'):
+        ...
+    METRICS.inc('toll_outcomes_total', labels={'status': status})
+
+and it can be read as Prometheus text (optionally served on a local
+`/metrics` endpoint) or dumped as JSON when the program exits.
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    """Latency samples in seconds: exact count and sum, quantiles over the most recent `window` samples."""
+
+    def __init__(self, window=10000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {} # key -> callable returning the current value
+
+    def inc(self, name, amount=1, labels=None):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, labels=None):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """Record the duration of the block under stage_seconds{stage=...}."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, {'stage': stage})
+
+    def gauge(self, name, fn, labels=None):
+        """Register `fn()` to be sampled whenever metrics are read (e.g. a queue depth)."""
+        with self._lock:
+            self._gauges[_key(name, labels)] = fn
+
+    def _gauge_values(self):
+        with self._lock:
+            gauges = list(self._gauges.items())
+        values = {}
+        for key, fn in gauges:
+            try:
+                values[key] = fn()
+            except Exception:
+                pass
+        return values
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} summary")
+                typed.add(name)
+            for q, value in histogram.quantiles().items():
+                lines.append(f"{name}{_format_labels(labels, [('quantile', q)])} {value:.6f}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        for (name, labels), value in sorted(self._gauge_values().items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} gauge")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Plain-dict view of all metrics, for JSON."""
+        def label(name, labels):
+            return name + _format_labels(labels)
+        with self._lock:
+            counters = {label(*k): v for k, v in self._counters.items()}
+            histograms = {label(*k): {'count': h.count, 'sum': h.total,
+                                      **{f"p{int(q * 100)}": v for q, v in h.quantiles().items()}}
+                          for k, h in self._histograms.items()}
+        gauges = {label(*k): v for k, v in self._gauge_values().items()}
+        return {'counters': counters, 'latency_seconds': histograms, 'gauges': gauges}
+
+    def dump_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+
+    def drain(self):
+        """Return and clear raw counters and samples, for shipping to another process's registry."""
+        with self._lock:
+            raw = {'counters': list(self._counters.items()),
+                   'samples': [(k, list(h.samples)) for k, h in self._histograms.items()]}
+            self._counters.clear()
+            self._histograms.clear()
+        return raw
+
+    def merge(self, raw):
+        """Add the output of another registry's drain() into this one."""
+        for (name, labels), value in raw['counters']:
+            self.inc(name, value, dict(labels))
+        for (name, labels), samples in raw['samples']:
+            for value in samples:
+                self.observe(name, value, dict(labels))
+
+
+METRICS = Metrics()
+
+
+def start_http_server(port, host='127.0.0.1', registry=METRICS):
+    """Serve `registry` at http://host:port/metrics (Prometheus text) and /metrics.json on a daemon thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body = registry.render_prometheus().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body = json.dumps(registry.snapshot()).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Keep scrapes out of the console
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
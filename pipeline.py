@@ -0,0 +1,174 @@
+"""Staged, non-blocking recognition pipeline.
+
+    decode -> detect -> OCR -> toll settlement
+
+Each stage runs on its own thread(s) and hands jobs to the next through a
+bounded queue, so a new image can be decoded while the previous one is
+still in OCR, and a slow stage pushes back on the ones before it instead
+of letting work pile up. Finished jobs land on `results`, a plain
+thread-safe queue the Tk app drains from `root.after`, so no Tk call is
+ever made off the main thread.
+"""
+import itertools
+import queue
+import threading
+
+from config import PIPELINE_QUEUE_SIZE, PIPELINE_DETECT_BATCH_SIZE
+from metrics import METRICS
+from recognition import detect_batch, recognize_plates
+
+_STOP = object()
+
+
+class Job:
+    __slots__ = ('job_id', 'filepath', 'image', 'detections', 'detected_texts', 'toll_results', 'error')
+
+    def __init__(self, job_id, filepath):
+        self.job_id = job_id
+        self.filepath = filepath
+        self.image = None
+        self.detections = None
+        self.detected_texts = None # None: YOLO found nothing; []: nothing readable
+        self.toll_results = []
+        self.error = None
+
+
+class RecognitionPipeline:
+    """Runs images through decode, detect, OCR and settlement stages.
+
+    `submit` never blocks: it returns None when the input queue is full so
+    the caller can tell the operator to wait. `toll_processor` may be None
+    to run recognition only. With a RecognitionClient (inference_server.py)
+    detection and OCR happen on the shared server and `model`/`reader` are
+    not used; the file bytes are sent as they are.
+    """
+
+    def __init__(self, model, reader, toll_processor=None, evidence_writer=None,
+                 queue_size=PIPELINE_QUEUE_SIZE, detect_batch_size=PIPELINE_DETECT_BATCH_SIZE, client=None):
+        self.model = model
+        self.reader = reader
+        self.client = client
+        self.toll_processor = toll_processor
+        self.evidence_writer = evidence_writer
+        self.detect_batch_size = detect_batch_size
+        self.results = queue.Queue()
+        self._ids = itertools.count(1)
+
+        self._decode_q = queue.Queue(maxsize=queue_size)
+        self._detect_q = queue.Queue(maxsize=queue_size)
+        self._ocr_q = queue.Queue(maxsize=queue_size)
+        self._settle_q = queue.Queue(maxsize=queue_size)
+        for stage, q in (('decode', self._decode_q), ('detect', self._detect_q), ('ocr', self._ocr_q),
+                         ('settle', self._settle_q)):
+            METRICS.gauge('queue_depth', q.qsize, {'queue': stage})
+        self._threads = [
+            threading.Thread(target=self._run_stage, args=(self._decode_q, self._detect_q, self._decode),
+                             name="pipeline-decode", daemon=True),
+            threading.Thread(target=self._run_detect, name="pipeline-detect", daemon=True),
+            threading.Thread(target=self._run_stage, args=(self._ocr_q, self._settle_q, self._ocr),
+                             name="pipeline-ocr", daemon=True),
+            # Settlement stays on one thread so tolls are charged in submission order
+            threading.Thread(target=self._run_stage, args=(self._settle_q, self.results, self._settle),
+                             name="pipeline-settle", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, filepath):
+        """Queue an image file. Returns its job id, or None if the pipeline is full."""
+        job = Job(next(self._ids), filepath)
+        try:
+            self._decode_q.put_nowait(job)
+        except queue.Full:
+            return None
+        return job.job_id
+
+    def pending(self):
+        """Rough number of jobs still inside the pipeline."""
+        return sum(q.qsize() for q in (self._decode_q, self._detect_q, self._ocr_q, self._settle_q))
+
+    def close(self, timeout=None):
+        """Finish every queued job, then stop the threads.
+
+        With a `timeout` (seconds per stage) jobs still inside when it runs
+        out are abandoned, never settled, and reported. Returns their number.
+        """
+        self._decode_q.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        if not any(thread.is_alive() for thread in self._threads):
+            return 0
+        abandoned = max(self.pending(), 1) # At least the job a stage is still working on
+        print(f"Warning: pipeline closed with about {abandoned} image(s) not finished; "
+              "their plates were not settled.")
+        return abandoned
+
+    # --- Stages ---
+    def _decode(self, job):
+        if self.client is not None:
+            with open(job.filepath, 'rb') as f:
+                job.image = f.read() # The server decodes
+            return
+        import cv2 # Deferred so the app starts without loading OpenCV
+        with METRICS.time('decode'):
+            job.image = cv2.imread(job.filepath)
+        if job.image is None:
+            job.error = "Could not read image file."
+
+    def _ocr(self, job):
+        if self.client is not None:
+            job.detected_texts = self.client.recognize_bytes(job.image, job.filepath)
+            job.image = None
+            return
+        job.detected_texts = recognize_plates(self.model, self.reader, job.image, job.filepath,
+                                              self.evidence_writer, detections=job.detections)
+        job.image = None # Free the frame as soon as it has been read
+
+    def _settle(self, job):
+        if self.toll_processor is None or not job.detected_texts:
+            return
+        for det_plate_info in job.detected_texts:
+            job.toll_results.append(self.toll_processor.process_plate(
+                det_plate_info['raw_plate'], det_plate_info['image_ref'], det_plate_info.get('candidates')))
+
+    def _run_stage(self, in_q, out_q, fn):
+        while True:
+            job = in_q.get()
+            if job is _STOP:
+                if out_q is not self.results:
+                    out_q.put(_STOP)
+                return
+            if job.error is None:
+                try:
+                    fn(job)
+                except Exception as e:
+                    job.error = str(e)
+            if out_q is self.results:
+                METRICS.inc('images_processed_total', labels={'result': 'error' if job.error else 'ok'})
+            out_q.put(job)
+
+    def _run_detect(self):
+        # Like _run_stage, but takes whatever else is already waiting (up to
+        # detect_batch_size) so a backlog goes through YOLO in one call.
+        stopping = False
+        while not stopping:
+            batch = [self._detect_q.get()]
+            while len(batch) < self.detect_batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._detect_q.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                stopping = True
+                batch.pop()
+            jobs = [job for job in batch if job.error is None]
+            if jobs and self.client is None: # The server detects for remote jobs
+                try:
+                    for job, det in zip(jobs, detect_batch(self.model, [job.image for job in jobs])):
+                        job.detections = det
+                except Exception as e:
+                    for job in jobs:
+                        job.error = str(e)
+            for job in batch:
+                self._ocr_q.put(job)
+        self._ocr_q.put(_STOP)
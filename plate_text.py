@@ -0,0 +1,179 @@
+"""Turn EasyOCR tokens into plate numbers.
+
+EasyOCR returns one token per text region it finds on the crop: the plate
+number, but also city or province names printed on the plate and, on
+two-line plates, each line separately. Instead of gluing everything
+together, the engine
+
+  * orders the tokens into lines (top to bottom, left to right),
+  * drops region words (PLATE_REGION_WORDS), whole or stuck to a token,
+  * matches the remaining text against the regional plate grammars
+    (PLATE_GRAMMARS), correcting look-alike characters (PLATE_CONFUSIONS)
+    where a grammar expects a letter and got a digit or vice versa,
+
+and returns the candidates best first. The toll processor then charges the
+first candidate that is registered (see TollProcessor.process_plate).
+"""
+import re
+from collections import namedtuple
+
+from config import PLATE_GRAMMARS, PLATE_REGION_WORDS, PLATE_CONFUSIONS
+
+# One reading of the plate. `grammar` is the index in PLATE_GRAMMARS that
+# matched (None: no grammar did, the text is passed through as read),
+# `corrections` how many look-alike characters were swapped and `partial`
+# whether the grammar only matched part of the text.
+PlateCandidate = namedtuple('PlateCandidate', ['text', 'confidence', 'grammar', 'corrections', 'partial'])
+
+_CLASS_TOKEN = re.compile(r'(\[A-Z\]|\[0-9\])(\{\d+(?:,\d+)?\}|[?+*])?')
+
+
+def clean(text):
+    return "".join(filter(str.isalnum, text)).upper()
+
+
+class PlateGrammar:
+    """One plate format, written as a sequence of [A-Z] / [0-9] classes with quantifiers.
+
+    `strict` is the grammar as written; `loose` also accepts a character's
+    look-alike at each position, with one capture group per class so the
+    look-alikes can be swapped back afterwards.
+    """
+
+    def __init__(self, pattern, confusions):
+        to_letter = {digit: letter for letter, digit in confusions}
+        to_digit = {letter: digit for letter, digit in confusions}
+        strict, loose, kinds = [], [], []
+        pos = 0
+        while pos < len(pattern):
+            match = _CLASS_TOKEN.match(pattern, pos)
+            if match is None:
+                raise ValueError(f"Unsupported plate grammar {pattern!r} at position {pos}: "
+                                 "use [A-Z] and [0-9] with quantifiers")
+            cls, quantifier = match.group(1), match.group(2) or ''
+            is_letter = cls == '[A-Z]'
+            extra = "".join(sorted(to_letter if is_letter else to_digit))
+            strict.append(cls + quantifier)
+            loose.append(f"([{cls[1:-1]}{extra}]{quantifier})")
+            kinds.append(to_letter if is_letter else to_digit)
+            pos = match.end()
+        self.pattern = pattern
+        self.strict = re.compile("".join(strict))
+        self.loose = re.compile("".join(loose))
+        self._kinds = kinds
+
+    def readings(self, text):
+        """Ways to read `text` as this format: a list of (plate, corrections, partial).
+
+        Both the strict reading and the look-alike corrected one are kept when
+        they differ (MH2OEE7777 is valid as written, but MH20EE7777 may be
+        the registered plate); substring matches are only tried when the
+        whole text does not fit.
+        """
+        found = []
+        for finder, partial in ((self.strict.fullmatch, False), (self.loose.fullmatch, False),
+                                (self.strict.search, True), (self.loose.search, True)):
+            if partial and found:
+                break
+            match = finder(text)
+            corrected = self._correct(match) if match is not None else None
+            if corrected is not None:
+                found.append(corrected + (partial,))
+        return found
+
+    def _correct(self, match):
+        """(plate, corrections) for a match, or None if a whole letter or digit group was swapped.
+
+        A group made up only of look-alikes (1234 read as IZ34) is a guess
+        at characters the plate does not show, not a correction.
+        """
+        if not match.re.groups: # Strict pattern: nothing to swap
+            return match.group(0), 0
+        plate, corrections = [], 0
+        for group, swap in zip(match.groups(), self._kinds):
+            swapped = [swap[ch] for ch in group if ch in swap]
+            if group and len(swapped) == len(group):
+                return None
+            plate.extend(swap.get(ch, ch) for ch in group)
+            corrections += len(swapped)
+        return "".join(plate), corrections
+
+
+def _token_lines(tokens):
+    """Group (box, text, confidence) tokens into lines, returned top to bottom, each left to right."""
+    placed = []
+    for box, text, conf in tokens:
+        ys = [p[1] for p in box]
+        xs = [p[0] for p in box]
+        placed.append(((min(ys) + max(ys)) / 2, max(ys) - min(ys), min(xs), text, conf))
+    placed.sort()
+    lines = []
+    for token in placed:
+        center, height = token[0], token[1]
+        if lines and abs(center - lines[-1][0][0]) <= max(height, lines[-1][0][1]) / 2:
+            lines[-1].append(token)
+        else:
+            lines.append([token])
+    return [[(text, conf) for _, _, _, text, conf in sorted(line, key=lambda t: t[2])] for line in lines]
+
+
+class PlateTextEngine:
+    def __init__(self, grammars=PLATE_GRAMMARS, region_words=PLATE_REGION_WORDS, confusions=PLATE_CONFUSIONS):
+        self.grammars = [PlateGrammar(pattern, confusions) for pattern in grammars]
+        words = sorted((clean(w) for w in region_words), key=len, reverse=True)
+        alternatives = "|".join(map(re.escape, words)) or "(?!)"
+        self._region_word = re.compile(f"(?:{alternatives})+")
+        self._region_edge = re.compile(f"^(?:{alternatives})+|(?:{alternatives})+$")
+
+    def strip_region_words(self, text):
+        """Remove region words forming or stuck to either end of `text`.
+
+        Words are only stripped from a token if letters remain: ICT1234 is
+        kept whole rather than cut down to a bare number.
+        """
+        if self._region_word.fullmatch(text):
+            return ""
+        stripped = self._region_edge.sub("", text)
+        return stripped if any(ch.isalpha() for ch in stripped) else text
+
+    def candidates(self, tokens):
+        """Rank readings of EasyOCR `readtext(detail=1)` output, best first.
+
+        Returns a list of PlateCandidate with distinct texts, empty when
+        nothing alphanumeric was read.
+        """
+        lines = []
+        for line in _token_lines(tokens):
+            kept = [(self.strip_region_words(clean(text)), conf) for text, conf in line]
+            kept = [(text, conf) for text, conf in kept if text]
+            if kept:
+                lines.append(kept)
+        if not lines:
+            return []
+
+        # Texts worth trying: the whole plate, each line, each token
+        tokens = [token for line in lines for token in line]
+        pieces = [tokens] + lines + [[token] for token in tokens]
+        found = {}
+        for piece in pieces:
+            text = "".join(t for t, _ in piece)
+            conf = sum(c for _, c in piece) / len(piece)
+            readings = [(i, reading) for i, grammar in enumerate(self.grammars)
+                        for reading in grammar.readings(text)]
+            for grammar, (plate, corrections, partial) in readings or [(None, (text, 0, False))]:
+                candidate = PlateCandidate(plate, conf, grammar, corrections, partial)
+                if plate not in found or _rank(candidate) > _rank(found[plate]):
+                    found[plate] = candidate
+        ranked = sorted(found.values(), key=_rank, reverse=True)
+        if ranked[0].grammar is not None:
+            # Text that fits no plate format is only a fallback
+            ranked = [c for c in ranked if c.grammar is not None]
+        return ranked
+
+
+def _rank(candidate):
+    return (candidate.grammar is not None, not candidate.partial, -candidate.corrections,
+            candidate.confidence, len(candidate.text))
+
+
+PLATE_TEXT = PlateTextEngine()
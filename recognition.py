@@ -0,0 +1,406 @@
+"""Headless plate recognition: YOLO detection, cropping and EasyOCR.
+
+Used by the Tk app and by the batch tools so both read plates the same way.
+"""
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+from batching import next_batch
+from config import (MODEL_PATH, DETECTOR_BACKEND, OCR_MIN_CONFIDENCE, OCR_MIN_BOX_SIZE, PLATE_ASPECT_RANGE,
+                    PLATE_CLASS_IDS, OCR_PLATE_HEIGHT, OCR_DESKEW, DETECT_TILE_SIZE, DETECT_TILE_OVERLAP,
+                    DETECT_TILE_MIN_SIZE, DETECT_TILE_NMS_IOU)
+from evidence import evidence_name
+from metrics import METRICS
+from plate_text import PLATE_TEXT
+
+DETECTOR_BACKENDS = ('torch', 'onnx', 'openvino')
+
+
+def exported_model_path(model_path, backend):
+    """Where ultralytics writes the `backend` export of `model_path`."""
+    stem = os.path.splitext(model_path)[0]
+    return {'torch': model_path, 'onnx': stem + '.onnx', 'openvino': stem + '_openvino_model'}[backend]
+
+
+def export_detector(model_path=MODEL_PATH, backend=DETECTOR_BACKEND):
+    """Export the YOLO weights for `backend` unless an up-to-date export exists.
+
+    Returns the path to load. The export is cached next to the weights and
+    redone only when the weights are newer than it.
+    """
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown detector backend: {backend}")
+    target = exported_model_path(model_path, backend)
+    if backend == 'torch':
+        return target
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(model_path):
+        return target
+    from ultralytics import YOLO
+    print(f"Exporting {model_path} for {backend}, this is done once...")
+    with METRICS.time('model_export'):
+        # dynamic: accept any batch size so detect_batch keeps batching
+        exported = YOLO(model_path).export(format=backend, dynamic=True)
+    return exported or target
+
+
+def load_models(model_path=MODEL_PATH, backend=DETECTOR_BACKEND):
+    """Load the YOLO detector (on the given runtime backend) and the EasyOCR reader."""
+    # Imported here rather than at module level: ultralytics pulls in torch,
+    # and together they take seconds to import that callers which never run
+    # recognition (or run it later) should not pay up front.
+    import easyocr
+    from ultralytics import YOLO
+
+    detector_path = export_detector(model_path, backend)
+    with METRICS.time('model_load'):
+        # Exported models load through the same YOLO wrapper, so detect_batch
+        # gets the same Results (boxes.xyxy / conf / cls) on every backend.
+        model = YOLO(detector_path, task='detect')
+        reader = easyocr.Reader(['en'])
+    return model, reader
+
+
+class ModelLoader:
+    """Loads (and optionally warms up) the models on a background thread.
+
+    `state` goes from "not loaded" to "loading" and then "ready" or
+    "failed" (with the exception in `error`). `wait()` blocks until loading
+    has finished and returns (model, reader).
+    """
+
+    def __init__(self, model_path=MODEL_PATH, warmup=True, backend=DETECTOR_BACKEND):
+        self.model_path = model_path
+        self.backend = backend
+        self.warmup = warmup
+        self.state = "not loaded"
+        self.error = None
+        self.model = None
+        self.reader = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self.state = "loading"
+            self._thread = threading.Thread(target=self._load, name="model-loader", daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def _load(self):
+        try:
+            model, reader = load_models(self.model_path, self.backend)
+            if self.warmup:
+                # The first call builds the predictor and allocates buffers; do
+                # it now so the first real image does not pay for it.
+                import numpy as np
+                with METRICS.time('model_warmup'):
+                    detect_batch(model, [np.zeros((64, 64, 3), dtype=np.uint8)])
+            self.model, self.reader = model, reader
+            self.state = "ready"
+            print("YOLO model and EasyOCR reader loaded.")
+        except Exception as e:
+            self.error = e
+            self.state = "failed"
+            print(f"Error loading models: {e}. Recognition features will be disabled.")
+        finally:
+            self._done.set()
+
+    def wait(self, timeout=None):
+        self.start()
+        if not self._done.wait(timeout):
+            raise TimeoutError("Models are still loading.")
+        if self.error is not None:
+            raise self.error
+        return self.model, self.reader
+
+
+def box_skip_reason(box, conf, cls_id):
+    """Why a detected box is not worth OCR ('confidence', 'class' or 'size'), or None to read it."""
+    if conf < OCR_MIN_CONFIDENCE:
+        return 'confidence'
+    if PLATE_CLASS_IDS is not None and int(cls_id) not in PLATE_CLASS_IDS:
+        return 'class'
+    width, height = box[2] - box[0], box[3] - box[1]
+    min_width, min_height = OCR_MIN_BOX_SIZE
+    if width < min_width or height < min_height:
+        return 'size'
+    if not PLATE_ASPECT_RANGE[0] <= width / height <= PLATE_ASPECT_RANGE[1]:
+        return 'size'
+    return None
+
+
+def _deskew_angle(gray):
+    """Angle in degrees that levels the characters of a grayscale plate crop (0 if unsure)."""
+    import cv2
+    import numpy as np
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    points = cv2.findNonZero(binary)
+    if points is None or len(points) < 20:
+        return 0.0
+    angle = cv2.minAreaRect(points)[2]
+    # minAreaRect reports angles in different ranges across OpenCV versions;
+    # fold into (-45, 45] so we always turn the short way round.
+    if angle > 45:
+        angle -= 90
+    elif angle <= -45:
+        angle += 90
+    return float(np.clip(angle, -20, 20)) # Anything steeper is more likely noise than tilt
+
+
+def prepare_plate_crop(crop):
+    """Normalize a plate crop for OCR: canonical height, grayscale, deskewed."""
+    import cv2
+    with METRICS.time('ocr_preprocess'):
+        if OCR_PLATE_HEIGHT and crop.shape[0] != OCR_PLATE_HEIGHT:
+            scale = OCR_PLATE_HEIGHT / crop.shape[0]
+            interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+            crop = cv2.resize(crop, (max(1, round(crop.shape[1] * scale)), OCR_PLATE_HEIGHT),
+                              interpolation=interpolation)
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        if OCR_DESKEW:
+            angle = _deskew_angle(gray)
+            if abs(angle) >= 0.5:
+                h, w = gray.shape
+                rotation = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+                gray = cv2.warpAffine(gray, rotation, (w, h), flags=cv2.INTER_LINEAR,
+                                      borderMode=cv2.BORDER_REPLICATE)
+    return gray
+
+
+def read_plate_candidates(reader, crop):
+    """OCR one plate crop (a numpy image) and return the plate readings best first, possibly none.
+
+    Region words are dropped and the plate grammars applied (see plate_text.py).
+    """
+    crop = prepare_plate_crop(crop)
+    with METRICS.time('ocr'):
+        # detail=1 keeps each token's box and confidence for the text engine
+        ocr_result = reader.readtext(crop, detail=1, paragraph=False)
+    candidates = [c.text for c in PLATE_TEXT.candidates(ocr_result)]
+    if not candidates:
+        METRICS.inc('ocr_misses_total')
+    return candidates
+
+
+# Per-image detector output, as numpy arrays: boxes (N, 4) in xyxy format,
+# confidences (N,) and class_ids (N,)
+Detections = namedtuple('Detections', ['boxes', 'confidences', 'class_ids'])
+
+
+def tile_grid(width, height, tile_size, overlap):
+    """(x0, y0, x1, y1) windows of `tile_size` covering the image, overlapping by `overlap`."""
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        return positions + [length - tile_size] # Last tile flush with the edge
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in starts(height) for x in starts(width)]
+
+
+def merge_boxes(boxes, confidences, class_ids, iou_threshold, containment=0.8):
+    """Indices of the boxes kept by class-aware NMS, best first.
+
+    Besides overlapping boxes (IoU > `iou_threshold`), a box mostly inside a
+    more confident one (`containment` of its own area) is dropped: that is
+    a plate cut in half by a tile seam, with the whole plate found in the
+    neighbouring tile.
+    """
+    import numpy as np
+    order = np.argsort(-confidences)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        i, rest = order[0], order[1:]
+        keep.append(int(i))
+        w = np.clip(np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0]), 0, None)
+        h = np.clip(np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1]), 0, None)
+        inter = w * h
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        inside = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        same_class = class_ids[rest] == class_ids[i]
+        order = rest[~same_class | ((iou <= iou_threshold) & (inside <= containment))]
+    return keep
+
+
+def detect_batch(model, images):
+    """Run YOLO once over a list of images.
+
+    Returns one Detections per image, or None for an image YOLO returned no
+    boxes for. With DETECT_TILE_SIZE set, large images are also cut into
+    overlapping tiles that go into the same batch (see detect_tiled).
+    """
+    images = list(images)
+    if DETECT_TILE_SIZE and any(max(image.shape[:2]) > DETECT_TILE_MIN_SIZE for image in images):
+        detections = detect_tiled(model, images)
+    else:
+        detections = _detect(model, images)
+    METRICS.inc('detections_total', sum(len(det.boxes) for det in detections if det is not None))
+    return detections
+
+
+def detect_tiled(model, images, tile_size=DETECT_TILE_SIZE, overlap=DETECT_TILE_OVERLAP,
+                 min_size=DETECT_TILE_MIN_SIZE, iou_threshold=DETECT_TILE_NMS_IOU):
+    """detect_batch for high-resolution frames.
+
+    Every image is detected whole (which finds plates close to the camera,
+    even across tile seams); images larger than `min_size` are also cut into
+    tiles, so small distant plates are seen near native resolution instead
+    of being downscaled away. All views of all images run as one batch, tile
+    boxes are shifted back to full-image coordinates and merged with NMS.
+    """
+    import numpy as np
+    views, owners = [], [] # owners: (image index, x offset, y offset) per view
+    for n, image in enumerate(images):
+        views.append(image)
+        owners.append((n, 0, 0))
+        height, width = image.shape[:2]
+        if max(height, width) > min_size:
+            for x0, y0, x1, y1 in tile_grid(width, height, tile_size, overlap):
+                views.append(np.ascontiguousarray(image[y0:y1, x0:x1]))
+                owners.append((n, x0, y0))
+    METRICS.observe('detect_tiles', len(views) - len(images))
+
+    parts = [[] for _ in images]
+    for (n, dx, dy), det in zip(owners, _detect(model, views)):
+        if det is not None and len(det.boxes):
+            parts[n].append(Detections(det.boxes + np.array([dx, dy, dx, dy], dtype=det.boxes.dtype),
+                                       det.confidences, det.class_ids))
+
+    merged = []
+    for found in parts:
+        if not found:
+            merged.append(None)
+            continue
+        boxes = np.concatenate([d.boxes for d in found])
+        confidences = np.concatenate([d.confidences for d in found])
+        class_ids = np.concatenate([d.class_ids for d in found])
+        keep = merge_boxes(boxes, confidences, class_ids, iou_threshold)
+        merged.append(Detections(boxes[keep], confidences[keep], class_ids[keep]))
+    return merged
+
+
+def _detect(model, images):
+    with METRICS.time('detect'):
+        results = model(images) # One forward pass for the whole batch
+    METRICS.observe('detect_batch_size', len(images))
+    detections = []
+    for result in results:
+        # The structure of 'results' might vary slightly based on ultralytics version
+        # Assuming result.boxes gives access to bounding boxes
+        if result.boxes is None:
+            detections.append(None)
+            continue
+        detections.append(Detections(
+            result.boxes.xyxy.cpu().numpy(), # Get boxes in xyxy format
+            result.boxes.conf.cpu().numpy(), # Get confidences
+            result.boxes.cls.cpu().numpy(), # Get class IDs
+        ))
+    return detections
+
+
+class BatchDetector:
+    """Groups images from many callers into batched YOLO calls.
+
+    Callers `submit` single images and get a Future back. A background thread
+    collects requests until `max_batch_size` images are waiting or the oldest
+    one has waited `max_latency` seconds, runs the model once for the whole
+    batch and resolves each Future with that image's Detections.
+    """
+
+    def __init__(self, model, max_batch_size=8, max_latency=0.05):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="batch-detector", daemon=True)
+        self._thread.start()
+
+    def submit(self, image):
+        future = Future()
+        self._queue.put((image, future, time.monotonic()))
+        return future
+
+    def detect(self, image):
+        return self.submit(image).result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = next_batch(self._queue, self.max_batch_size, self.max_latency)
+            if batch is None:
+                return
+            images = [image for image, _, _ in batch]
+            futures = [future for _, future, _ in batch]
+            try:
+                detections = detect_batch(self.model, images)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, det in zip(futures, detections):
+                future.set_result(det)
+
+
+_RUN_DETECTION = object()
+
+
+def recognize_plates(model, reader, image, source_name, evidence_writer=None, detections=_RUN_DETECTION):
+    """Detect plates in `image` and OCR each of them.
+
+    Pass `detections` (a Detections or None, as returned by detect_batch)
+    when the image already went through a batched detection call; otherwise
+    `model` is run on the image on its own.
+
+    Crops go to EasyOCR straight from memory. They are only written to disk
+    when an `evidence_writer` is given, and then asynchronously.
+
+    Returns a list of {'raw_plate', 'candidates', 'image_ref', 'box',
+    'confidence', 'class_id'} dicts, or None when YOLO
+    returned no boxes at all (so callers can tell "nothing detected" apart
+    from "detected but unreadable").
+    """
+    if detections is _RUN_DETECTION:
+        detections = detect_batch(model, [image])[0]
+    if detections is None:
+        return None
+
+    detected_texts = []
+    for i, (box, conf, cls_id) in enumerate(zip(*detections)):
+        # Junk boxes (low confidence, wrong class, too small to read) never
+        # reach EasyOCR, which is by far the most expensive step per box.
+        reason = box_skip_reason(box, conf, cls_id)
+        if reason is not None:
+            METRICS.inc('boxes_skipped_total', labels={'reason': reason})
+            continue
+        x_min, y_min, x_max, y_max = map(int, box)
+        cropped_object = image[y_min:y_max, x_min:x_max]
+
+        # Sanity check for cropped image size
+        if cropped_object.size == 0:
+            print(f"Warning: Cropped object {i} is empty. Skipping.")
+            continue
+
+        candidates = read_plate_candidates(reader, cropped_object)
+
+        if candidates: # Only process if OCR found something
+            image_ref = evidence_name("cropped", source_name, i)
+            if evidence_writer is not None:
+                image_ref = evidence_writer.save(image_ref, cropped_object)
+            detected_texts.append({'raw_plate': candidates[0], 'candidates': candidates, 'image_ref': image_ref,
+                                   'box': [float(v) for v in box], 'confidence': float(conf),
+                                   'class_id': int(cls_id)})
+    return detected_texts
@@ -0,0 +1,121 @@
+"""Vehicle registry with a plate-keyed index."""
+import csv
+
+from config import VEHICLE_FIELDS
+
+
+class Vehicle:
+    """One registered vehicle.
+
+    `balance` is kept as the string stored on disk so a corrupt value is
+    reported as "Error - Invalid Balance" at toll time instead of failing
+    the whole load.
+    """
+    __slots__ = ('plate', 'owner', 'type', 'balance')
+
+    def __init__(self, plate, owner, type, balance):
+        self.plate = plate
+        self.owner = owner
+        self.type = type
+        self.balance = balance
+
+    def as_dict(self):
+        return {'plate': self.plate, 'owner': self.owner, 'type': self.type, 'balance': self.balance}
+
+
+class VehicleRegistry:
+    """Owns the vehicle records and keeps a plate -> Vehicle index in step with them.
+
+    Lookups, adds and renames are O(1); the list only exists to keep the
+    on-disk and on-screen order stable.
+
+    A plate loaded more than once (older files allowed it) resolves to its
+    first record, as the old linear scan did. The later records are kept
+    aside and written back by rows(), so loading never loses data; deleting
+    the plate removes them all.
+    """
+
+    def __init__(self, vehicles=(), source="vehicle data"):
+        self._records = []
+        self._index = {}
+        self._shadowed = [] # repeated plates, not looked up
+        for vehicle in vehicles:
+            if vehicle.plate in self._index:
+                print(f"Warning: plate {vehicle.plate} appears more than once in {source}; "
+                      "using its first record.")
+                self._shadowed.append(vehicle)
+            else:
+                self._insert(vehicle)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a registry from dicts with the VEHICLE_FIELDS keys (e.g. csv.DictReader rows)."""
+        return cls(Vehicle(row.get('plate', ''), row.get('owner', ''), row.get('type', ''), row.get('balance', ''))
+                   for row in rows)
+
+    @classmethod
+    def from_csv(cls, filename):
+        with open(filename, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader, VEHICLE_FIELDS)
+            cols = [header.index(field) for field in VEHICLE_FIELDS]
+            return cls((Vehicle(*(row[c] for c in cols)) for row in reader if row), source=filename)
+
+    def rows(self, balances=None):
+        """Yield the records as dicts, in registry order, ready for csv.DictWriter.
+
+        `balances` ({plate: balance}) overrides the balance of the looked-up
+        record of those plates, to write changes before applying them.
+        """
+        balances = balances or {}
+        for vehicle in self._records:
+            yield dict(vehicle.as_dict(), balance=balances.get(vehicle.plate, vehicle.balance))
+        for vehicle in self._shadowed:
+            yield vehicle.as_dict()
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __contains__(self, plate):
+        return plate in self._index
+
+    def find(self, plate):
+        return self._index.get(plate)
+
+    def _insert(self, vehicle):
+        if vehicle.plate in self._index:
+            raise ValueError(f"Vehicle with plate {vehicle.plate} already exists.")
+        self._index[vehicle.plate] = vehicle
+        self._records.append(vehicle)
+
+    def add(self, plate, owner, type, balance):
+        vehicle = Vehicle(plate, owner, type, balance)
+        self._insert(vehicle)
+        return vehicle
+
+    def update(self, original_plate, plate, owner, type, balance):
+        """Update the vehicle registered as `original_plate`, renaming it if `plate` differs."""
+        vehicle = self._index.get(original_plate)
+        if vehicle is None:
+            raise KeyError(original_plate)
+        if plate != original_plate:
+            if plate in self._index:
+                raise ValueError(f"Another vehicle with plate {plate} already exists.")
+            del self._index[original_plate]
+            self._index[plate] = vehicle
+        vehicle.plate = plate
+        vehicle.owner = owner
+        vehicle.type = type
+        vehicle.balance = balance
+        return vehicle
+
+    def delete(self, plate):
+        vehicle = self._index.pop(plate, None)
+        if vehicle is None:
+            return None
+        self._records.remove(vehicle)
+        self._shadowed = [v for v in self._shadowed if v.plate != plate]
+        return vehicle
@@ -0,0 +1,131 @@
+"""Toll settlement shared by several lanes.
+
+Lanes (pipeline workers, stream processors, manual entry) `submit` plate
+events from any thread and get a Future back. A single writer thread owns
+every balance change: it collects events until SETTLEMENT_BATCH_SIZE are
+waiting or the oldest has waited SETTLEMENT_MAX_DELAY seconds, applies the
+toll rules to them in arrival order and persists the whole batch at once
+(storage.charge_tolls: one log write + vehicles save for CSV, one
+transaction for SQLite). Two lanes charging the same account can therefore
+never both read the old balance.
+
+An event may carry an `event_id` (e.g. lane + frame or a sensor's
+transaction number). A lane that retries an event after a timeout or crash
+gets the first outcome back, marked 'duplicate', instead of a second debit
+(across restarts only with SQLite storage, which records settled ids in the
+same transaction as the debit).
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+from batching import next_batch
+from config import DEFAULT_TOLL_AMOUNT, SETTLEMENT_BATCH_SIZE, SETTLEMENT_MAX_DELAY
+from metrics import METRICS
+from toll import TollProcessor, toll_result
+
+
+class SettlementEngine:
+    """Single-writer settlement with the same process_plate contract as TollProcessor.
+
+    `cache` is an optional RecognitionCache (dedup.py): a plate read again
+    within its window is logged as DUPLICATE_STATUS and not charged, as
+    with TollProcessor.
+    """
+
+    def __init__(self, storage, toll_amount=DEFAULT_TOLL_AMOUNT, cache=None, max_batch=SETTLEMENT_BATCH_SIZE,
+                 max_delay=SETTLEMENT_MAX_DELAY):
+        self.storage = storage
+        self.toll_amount = toll_amount
+        self.cache = cache
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._resolver = TollProcessor(storage, toll_amount)
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._queue = queue.Queue()
+        METRICS.gauge('queue_depth', self._queue.qsize, {'queue': 'settlement'})
+        self._thread = threading.Thread(target=self._run, name="settlement", daemon=True)
+        self._thread.start()
+
+    def submit(self, plate_number, image_ref, candidates=None, event_id=None):
+        """Queue one plate event; the Future resolves to the TollProcessor.process_plate result dict.
+
+        Raises RuntimeError once the engine is closed: nothing would settle
+        the event.
+        """
+        future = Future()
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError(f"Settlement engine is closed, {plate_number} was not settled.")
+            self._queue.put((plate_number, image_ref, candidates, event_id, timestamp, future, time.monotonic()))
+        return future
+
+    def process_plate(self, plate_number, image_ref, candidates=None, event_id=None):
+        """Settle one plate event and wait for the outcome."""
+        return self.submit(plate_number, image_ref, candidates, event_id).result()
+
+    def close(self):
+        """Settle everything already submitted, then stop the writer."""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = next_batch(self._queue, self.max_batch, self.max_delay)
+            if batch is None:
+                return
+            try:
+                self._settle(batch)
+            except Exception as e:
+                print(f"Settlement of {len(batch)} events failed: {e}")
+                for item in batch:
+                    if not item[5].done():
+                        item[5].set_exception(e)
+
+    def _settle(self, batch):
+        charges = []
+        pending = [] # (future, plate, cached result or None, reserved result or None) per charge
+        for plate_number, image_ref, candidates, event_id, timestamp, future, _ in batch:
+            if candidates:
+                plate_number = self._resolver.resolve_plate(plate_number, candidates)
+            cached = reserved = None
+            if self.cache is not None:
+                # A reservation lets repeats later in this batch match the plate too
+                cached = self.cache.get(plate_number, self._resolver.is_registered)
+                if cached is None:
+                    reserved = self.cache.reserve(plate_number)
+            charges.append((event_id, plate_number, self.toll_amount, timestamp, image_ref, cached is not None))
+            pending.append((future, plate_number, cached, reserved))
+
+        METRICS.observe('settle_batch_size', len(charges))
+        try:
+            with METRICS.time('settle'):
+                outcomes = self.storage.charge_tolls(charges)
+        except Exception:
+            for _, plate_number, _, reserved in pending:
+                if reserved is not None:
+                    self.cache.discard(plate_number)
+            raise
+
+        for (future, plate_number, cached, reserved), (status, vehicle, replayed) in zip(pending, outcomes):
+            if cached is not None:
+                # Reservations earlier in the batch are filled in by now
+                METRICS.inc('toll_duplicates_total')
+                result = dict(cached, duplicate=True)
+            else:
+                if replayed:
+                    METRICS.inc('toll_replays_total')
+                else:
+                    METRICS.inc('toll_outcomes_total', labels={'status': status})
+                result = toll_result(plate_number, status, vehicle, duplicate=replayed)
+                if reserved is not None:
+                    reserved.update(result)
+            future.set_result(result)
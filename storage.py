@@ -0,0 +1,454 @@
+"""Storage backends for vehicles and the toll log.
+
+`CsvStorage` keeps the original vehicles_db.csv / toll_log.csv files.
+`SqliteStorage` keeps both in one SQLite database in WAL mode: a toll
+debit and its log row commit in a single transaction, plate lookups go
+through the primary-key index, and several booth processes can share the
+database file.
+
+Both expose the same methods, so the app picks one with STORAGE_BACKEND.
+To move existing CSV data into a database:
+
+    python storage.py import --db toll_system.db vehicles_db.csv toll_log.csv
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from config import (STORAGE_BACKEND, SQLITE_DB_FILE, VEHICLES_DB_FILE, TOLL_LOG_FILE, VEHICLE_FIELDS,
+                    TOLL_LOG_FIELDS, SETTLEMENT_EVENT_MEMORY)
+from metrics import METRICS
+from registry import Vehicle, VehicleRegistry
+from toll import DUPLICATE_STATUS, decide_toll, init_csv_files, save_csv
+from toll_log import TollLogWriter, TollLogReader
+
+
+class CsvStorage:
+    """Vehicles in a CSV rewritten on change, toll log in an append-only CSV.
+
+    `save_data` has the signature of `save_csv` and must raise on failure;
+    the bulk methods and charge_tolls rely on that to leave the registry
+    unchanged when the file could not be written.
+    """
+
+    def __init__(self, vehicles_file=VEHICLES_DB_FILE, toll_log_file=TOLL_LOG_FILE, save_data=save_csv):
+        init_csv_files(vehicles_file, toll_log_file)
+        self.vehicles_file = vehicles_file
+        self.toll_log_file = toll_log_file
+        self.save_data = save_data
+        self.registry = VehicleRegistry.from_csv(vehicles_file)
+        self.toll_log = TollLogWriter(toll_log_file)
+        self._lock = threading.RLock()
+        self._settled = OrderedDict() # event id -> status, most recent last
+
+    def _save_vehicles(self):
+        with METRICS.time('vehicles_save'):
+            self.save_data(self.vehicles_file, self.registry.rows(), VEHICLE_FIELDS)
+
+    def vehicles(self):
+        with self._lock:
+            return list(self.registry)
+
+    def find_vehicle(self, plate):
+        with self._lock:
+            return self.registry.find(plate)
+
+    def add_vehicle(self, plate, owner, v_type, balance):
+        with self._lock:
+            vehicle = self.registry.add(plate, owner, v_type, balance)
+            self._save_vehicles()
+            return vehicle
+
+    def update_vehicle(self, original_plate, plate, owner, v_type, balance):
+        with self._lock:
+            vehicle = self.registry.update(original_plate, plate, owner, v_type, balance)
+            self._save_vehicles()
+            return vehicle
+
+    def delete_vehicle(self, plate):
+        with self._lock:
+            vehicle = self.registry.delete(plate)
+            self._save_vehicles()
+            return vehicle
+
+    def bulk_upsert_vehicles(self, vehicles):
+        """Add or replace many (plate, owner, type, balance) records with one file write.
+
+        Returns (added, updated). The registry is only changed once the file
+        has been written.
+        """
+        with self._lock:
+            new = {plate: Vehicle(plate, owner, v_type, balance) for plate, owner, v_type, balance in vehicles}
+            rows = []
+            replaced = set()
+            for row in self.registry.rows():
+                if row['plate'] in replaced:
+                    continue # A repeat of a plate this import replaces
+                replacement = new.pop(row['plate'], None)
+                if replacement is not None:
+                    replaced.add(row['plate'])
+                    row = replacement.as_dict()
+                rows.append(row)
+            updated = len(replaced)
+            rows.extend(v.as_dict() for v in new.values())
+            with METRICS.time('vehicles_save'):
+                self.save_data(self.vehicles_file, rows, VEHICLE_FIELDS)
+            self.registry = VehicleRegistry.from_rows(rows)
+            return len(new), updated
+
+    def bulk_top_up(self, amounts):
+        """Add {plate: amount} to balances and write the file once. Returns {plate: new balance}.
+
+        Raises KeyError for an unregistered plate and ValueError for an
+        invalid stored balance, before anything is changed.
+        """
+        with self._lock:
+            balances = {plate: _topped_up(self.registry.find(plate), plate, amount)
+                        for plate, amount in amounts.items()}
+            rows = list(self.registry.rows(balances))
+            with METRICS.time('vehicles_save'):
+                self.save_data(self.vehicles_file, rows, VEHICLE_FIELDS)
+            for plate, balance in balances.items():
+                self.registry.find(plate).balance = balance
+            return balances
+
+    def charge_toll(self, plate, amount, timestamp, image_ref):
+        """Apply the toll rules to `plate` and log the outcome.
+
+        Returns (status, vehicle) where vehicle reflects any debit, or None
+        for an unregistered plate. Nothing changes in memory unless both
+        files were written (see charge_tolls).
+        """
+        status, vehicle, _ = self.charge_tolls([(None, plate, amount, timestamp, image_ref, False)])[0]
+        return status, vehicle
+
+    def charge_tolls(self, charges):
+        """Settle a batch of (event_id, plate, amount, timestamp, image_ref, duplicate) in order.
+
+        A `duplicate` charge is only logged, as DUPLICATE_STATUS. Log rows go
+        out in arrival order in one write + fsync and the vehicles file is
+        rewritten at most once. Returns one (status, vehicle, replayed) per
+        charge; `replayed` is True for an event id settled before, which is
+        not charged or logged again (only the last SETTLEMENT_EVENT_MEMORY
+        ids are remembered, and only while this process runs).
+
+        Balances and settled ids are only changed in memory once both files
+        have been written. If the log write fails after the vehicles save,
+        the file is rewritten with the old balances before the error is
+        raised.
+        """
+        with self._lock:
+            outcomes, entries = [], []
+            balances = {} # plate -> balance after this batch
+            settled = {} # event id -> status, for this batch
+            for event_id, plate, amount, timestamp, image_ref, duplicate in charges:
+                known = settled.get(event_id, self._settled.get(event_id)) if event_id is not None else None
+                vehicle = self.registry.find(plate)
+                if vehicle is not None:
+                    # Copy: the registry keeps the old balance until the batch is written
+                    vehicle = Vehicle(vehicle.plate, vehicle.owner, vehicle.type,
+                                      balances.get(plate, vehicle.balance))
+                if known is not None:
+                    outcomes.append((known, vehicle, True))
+                    continue
+                status, new_balance = (DUPLICATE_STATUS, None) if duplicate else decide_toll(vehicle, amount)
+                if new_balance is not None:
+                    vehicle.balance = balances[plate] = new_balance
+                entries.append(make_log_entry(timestamp, plate, amount, status, image_ref))
+                outcomes.append((status, vehicle, False))
+                if event_id is not None:
+                    settled[event_id] = status
+
+            if balances:
+                rows = list(self.registry.rows(balances))
+                with METRICS.time('vehicles_save'):
+                    self.save_data(self.vehicles_file, rows, VEHICLE_FIELDS)
+            try:
+                self.toll_log.append_many(entries)
+            except Exception:
+                if balances:
+                    try:
+                        self._save_vehicles() # Put the undebited balances back on disk
+                    except Exception as e:
+                        print(f"Error restoring {self.vehicles_file} after a failed toll log write: {e}")
+                raise
+
+            for plate, balance in balances.items():
+                self.registry.find(plate).balance = balance
+            self._settled.update(settled)
+            while len(self._settled) > SETTLEMENT_EVENT_MEMORY:
+                self._settled.popitem(last=False)
+            return outcomes
+
+    def log_reader(self):
+        return TollLogReader(self.toll_log_file)
+
+    def close(self):
+        self.toll_log.close()
+
+
+class SqliteLogReader:
+    """Same interface as TollLogReader, tailing the toll_log table by row id."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.last_id = 0
+        self.reset = False
+
+    def read_new(self):
+        rows = self.storage._query(
+            "SELECT id, timestamp, plate, amount, status, image_ref FROM toll_log WHERE id > ? ORDER BY id",
+            (self.last_id,))
+        if rows:
+            self.last_id = rows[-1][0]
+        return [dict(zip(TOLL_LOG_FIELDS, row[1:])) for row in rows]
+
+
+class SqliteStorage:
+    """Vehicles and toll log in one SQLite database (WAL journal)."""
+
+    def __init__(self, path=SQLITE_DB_FILE):
+        self.path = path
+        # isolation_level=None: transactions are opened explicitly with
+        # BEGIN IMMEDIATE so the write lock is taken before the balance is read.
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS vehicles (
+                plate TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                type TEXT NOT NULL,
+                balance TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS toll_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                plate TEXT NOT NULL,
+                amount TEXT NOT NULL,
+                status TEXT NOT NULL,
+                image_ref TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS toll_log_plate ON toll_log (plate);
+            CREATE INDEX IF NOT EXISTS toll_log_timestamp ON toll_log (timestamp);
+            CREATE TABLE IF NOT EXISTS settled_events (
+                event_id TEXT PRIMARY KEY,
+                log_id INTEGER NOT NULL REFERENCES toll_log (id)
+            );
+        """)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _transaction(self, fn):
+        """Run fn(conn) inside BEGIN IMMEDIATE ... COMMIT, rolling back on error."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def vehicles(self):
+        return [Vehicle(*row) for row in
+                self._query("SELECT plate, owner, type, balance FROM vehicles ORDER BY rowid")]
+
+    def find_vehicle(self, plate):
+        rows = self._query("SELECT plate, owner, type, balance FROM vehicles WHERE plate = ?", (plate,))
+        return Vehicle(*rows[0]) if rows else None
+
+    def add_vehicle(self, plate, owner, v_type, balance):
+        try:
+            self._transaction(lambda conn: conn.execute(
+                "INSERT INTO vehicles (plate, owner, type, balance) VALUES (?, ?, ?, ?)",
+                (plate, owner, v_type, balance)))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Vehicle with plate {plate} already exists.")
+        return Vehicle(plate, owner, v_type, balance)
+
+    def update_vehicle(self, original_plate, plate, owner, v_type, balance):
+        def update(conn):
+            cur = conn.execute("UPDATE vehicles SET plate = ?, owner = ?, type = ?, balance = ? WHERE plate = ?",
+                               (plate, owner, v_type, balance, original_plate))
+            if cur.rowcount == 0:
+                raise KeyError(original_plate)
+        try:
+            self._transaction(update)
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Another vehicle with plate {plate} already exists.")
+        return Vehicle(plate, owner, v_type, balance)
+
+    def delete_vehicle(self, plate):
+        vehicle = self.find_vehicle(plate)
+        self._transaction(lambda conn: conn.execute("DELETE FROM vehicles WHERE plate = ?", (plate,)))
+        return vehicle
+
+    @staticmethod
+    def _charge(conn, plate, amount, timestamp, image_ref, duplicate=False):
+        """Debit and log one charge on `conn` (only log a duplicate). Returns (status, vehicle, log row id)."""
+        row = conn.execute("SELECT plate, owner, type, balance FROM vehicles WHERE plate = ?",
+                           (plate,)).fetchone()
+        vehicle = Vehicle(*row) if row else None
+        status, new_balance = (DUPLICATE_STATUS, None) if duplicate else decide_toll(vehicle, amount)
+        if new_balance is not None:
+            conn.execute("UPDATE vehicles SET balance = ? WHERE plate = ?", (new_balance, plate))
+            vehicle.balance = new_balance
+        entry = make_log_entry(timestamp, plate, amount, status, image_ref)
+        cur = conn.execute("INSERT INTO toll_log (timestamp, plate, amount, status, image_ref) VALUES (?, ?, ?, ?, ?)",
+                           [entry[field] for field in TOLL_LOG_FIELDS])
+        return status, vehicle, cur.lastrowid
+
+    def charge_toll(self, plate, amount, timestamp, image_ref):
+        """Debit and log in one transaction. Same contract as CsvStorage.charge_toll."""
+        with METRICS.time('storage_charge'):
+            return self._transaction(lambda conn: self._charge(conn, plate, amount, timestamp, image_ref)[:2])
+
+    def charge_tolls(self, charges):
+        """Same contract as CsvStorage.charge_tolls, as one transaction.
+
+        Settled event ids are recorded in the same transaction as the debit,
+        so an event is charged exactly once even across restarts and
+        between processes sharing the database.
+        """
+        def charge_all(conn):
+            outcomes = []
+            for event_id, plate, amount, timestamp, image_ref, duplicate in charges:
+                if event_id is not None:
+                    row = conn.execute("SELECT t.status FROM settled_events e JOIN toll_log t ON t.id = e.log_id"
+                                       " WHERE e.event_id = ?", (event_id,)).fetchone()
+                    if row is not None:
+                        vehicle = conn.execute("SELECT plate, owner, type, balance FROM vehicles WHERE plate = ?",
+                                               (plate,)).fetchone()
+                        outcomes.append((row[0], Vehicle(*vehicle) if vehicle else None, True))
+                        continue
+                status, vehicle, log_id = self._charge(conn, plate, amount, timestamp, image_ref, duplicate)
+                if event_id is not None:
+                    conn.execute("INSERT INTO settled_events (event_id, log_id) VALUES (?, ?)", (event_id, log_id))
+                outcomes.append((status, vehicle, False))
+            return outcomes
+        with METRICS.time('storage_charge'):
+            return self._transaction(charge_all)
+
+    def bulk_upsert_vehicles(self, vehicles):
+        """Add or replace many records in one transaction. Returns (added, updated)."""
+        vehicles = list(vehicles)
+
+        def upsert(conn):
+            before = conn.execute("SELECT COUNT(*) FROM vehicles").fetchone()[0]
+            conn.executemany("INSERT INTO vehicles (plate, owner, type, balance) VALUES (?, ?, ?, ?)"
+                             " ON CONFLICT (plate) DO UPDATE SET owner = excluded.owner, type = excluded.type,"
+                             " balance = excluded.balance", vehicles)
+            added = conn.execute("SELECT COUNT(*) FROM vehicles").fetchone()[0] - before
+            return added, len(vehicles) - added
+        with METRICS.time('vehicles_save'):
+            return self._transaction(upsert)
+
+    def bulk_top_up(self, amounts):
+        """Same contract as CsvStorage.bulk_top_up, in one transaction."""
+        def top_up(conn):
+            balances = {}
+            for plate, amount in amounts.items():
+                row = conn.execute("SELECT plate, owner, type, balance FROM vehicles WHERE plate = ?",
+                                   (plate,)).fetchone()
+                balances[plate] = _topped_up(Vehicle(*row) if row else None, plate, amount)
+            conn.executemany("UPDATE vehicles SET balance = ? WHERE plate = ?",
+                             [(balance, plate) for plate, balance in balances.items()])
+            return balances
+        with METRICS.time('vehicles_save'):
+            return self._transaction(top_up)
+
+    def log_reader(self):
+        return SqliteLogReader(self)
+
+    def import_csv(self, vehicles_file=None, toll_log_file=None):
+        """Copy CSV vehicles and log rows into the database in one transaction.
+
+        Like VehicleRegistry, the first record of a plate wins: repeats in
+        the file, and plates already in the database, are skipped with a
+        warning. Returns (vehicles imported, log rows imported).
+        """
+        def read_rows(filename, fields):
+            if not filename:
+                return []
+            with open(filename, 'r', newline='', encoding='utf-8') as f:
+                return [[row.get(field) or '' for field in fields] for row in csv.DictReader(f)]
+
+        vehicle_rows = read_rows(vehicles_file, VEHICLE_FIELDS)
+        log_rows = read_rows(toll_log_file, TOLL_LOG_FIELDS)
+
+        def load(conn):
+            skipped = []
+            for row in vehicle_rows:
+                cur = conn.execute("INSERT INTO vehicles (plate, owner, type, balance) VALUES (?, ?, ?, ?)"
+                                   " ON CONFLICT (plate) DO NOTHING", row)
+                if cur.rowcount == 0:
+                    skipped.append(row[0])
+            conn.executemany("INSERT INTO toll_log (timestamp, plate, amount, status, image_ref)"
+                             " VALUES (?, ?, ?, ?, ?)", log_rows)
+            return skipped
+        skipped = self._transaction(load)
+        if skipped:
+            print(f"Warning: {len(skipped)} vehicle records skipped, their plates were already loaded: "
+                  f"{', '.join(skipped[:10])}{' ...' if len(skipped) > 10 else ''}")
+        return len(vehicle_rows) - len(skipped), len(log_rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _topped_up(vehicle, plate, amount):
+    if vehicle is None:
+        raise KeyError(f"Vehicle {plate} is not registered.")
+    try:
+        return f"{float(vehicle.balance) + amount:.2f}"
+    except ValueError:
+        raise ValueError(f"Vehicle {plate} has an invalid balance: {vehicle.balance!r}")
+
+
+def make_log_entry(timestamp, plate, amount, status, image_ref):
+    return {
+        'timestamp': timestamp,
+        'plate': plate,
+        'amount': f"{amount:.2f}",
+        'status': status,
+        'image_ref': os.path.basename(image_ref) # Store only filename
+    }
+
+
+def open_storage(backend=STORAGE_BACKEND, vehicles_file=VEHICLES_DB_FILE, toll_log_file=TOLL_LOG_FILE,
+                 db_file=SQLITE_DB_FILE, save_data=save_csv):
+    if backend == 'sqlite':
+        return SqliteStorage(db_file)
+    if backend == 'csv':
+        return CsvStorage(vehicles_file, toll_log_file, save_data)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Storage maintenance for the toll system.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    imp = sub.add_parser('import', help="Import the CSV files into an SQLite database")
+    imp.add_argument('vehicles_csv', nargs='?', default=VEHICLES_DB_FILE)
+    imp.add_argument('toll_log_csv', nargs='?', default=TOLL_LOG_FILE)
+    imp.add_argument('--db', default=SQLITE_DB_FILE)
+    args = parser.parse_args(argv)
+
+    storage = SqliteStorage(args.db)
+    try:
+        n_vehicles, n_log = storage.import_csv(args.vehicles_csv, args.toll_log_csv)
+    finally:
+        storage.close()
+    print(f"Imported {n_vehicles} vehicles and {n_log} toll log rows into {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Video / camera stream processing with plate tracking.
+
+Frames are sampled from a cv2.VideoCapture source (file, camera index or
+stream URL) at a fixed rate and optionally only when something moves.
+Detected plate boxes are tracked across frames by IoU, so OCR runs once
+per vehicle (on its most confident crop) and each vehicle is charged once.
+
+    python stream.py booth_cam.mp4 --fps 5 --motion-threshold 4
+    python stream.py 0            # first local camera
+"""
+import argparse
+import itertools
+import time
+
+import cv2
+import numpy as np
+
+from config import (MODEL_PATH, DETECTOR_BACKEND, CROPPED_DIR, DEFAULT_TOLL_AMOUNT, STREAM_SAMPLE_FPS,
+                    STREAM_MOTION_THRESHOLD, METRICS_PORT, METRICS_JSON_FILE)
+from dedup import RecognitionCache
+from evidence import EvidenceWriter, evidence_name
+from metrics import METRICS, start_http_server
+from recognition import DETECTOR_BACKENDS, load_models, detect_batch, read_plate_candidates, box_skip_reason
+from storage import open_storage
+from toll import TollProcessor
+
+
+def box_iou(a, b):
+    """Intersection over union of two xyxy boxes."""
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    __slots__ = ('track_id', 'box', 'hits', 'missed', 'best_conf', 'best_crop', 'ocr_attempts',
+                 'ocr_crop', 'plate', 'result')
+
+    def __init__(self, track_id, box, conf, crop):
+        self.track_id = track_id
+        self.box = box
+        self.hits = 1
+        self.missed = 0
+        self.best_conf = conf
+        self.best_crop = crop
+        self.ocr_attempts = 0
+        self.ocr_crop = None # The best_crop last sent to OCR
+        self.plate = None   # OCR text once read
+        self.result = None  # Toll result once charged
+
+
+class PlateTracker:
+    """Greedy IoU tracker for plate boxes.
+
+    Each new box is matched to the unmatched live track it overlaps most
+    (IoU >= `iou_threshold`); unmatched boxes start new tracks. A track that
+    goes `max_missed` sampled frames without a match is dropped.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=5):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, boxes, confidences, crops):
+        """Match this frame's detections. Returns the tracks seen in this frame."""
+        unmatched = list(self.tracks)
+        seen = []
+        for box, conf, crop in sorted(zip(boxes, confidences, crops), key=lambda d: -d[1]):
+            best, best_iou = None, self.iou_threshold
+            for track in unmatched:
+                overlap = box_iou(track.box, box)
+                if overlap >= best_iou:
+                    best, best_iou = track, overlap
+            if best is None:
+                best = Track(next(self._ids), box, conf, crop)
+                self.tracks.append(best)
+            else:
+                unmatched.remove(best)
+                best.box = box
+                best.hits += 1
+                best.missed = 0
+                if conf > best.best_conf:
+                    best.best_conf, best.best_crop = conf, crop
+            seen.append(best)
+
+        for track in unmatched:
+            track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+        return seen
+
+
+class StreamProcessor:
+    """Runs detection, tracking, OCR and toll settlement over a video source.
+
+    `on_vehicle(track)` is called once per vehicle after it has been read
+    and charged (track.plate and track.result are set).
+    """
+
+    def __init__(self, model, reader, toll_processor=None, sample_fps=STREAM_SAMPLE_FPS,
+                 motion_threshold=STREAM_MOTION_THRESHOLD, min_hits=2, max_ocr_attempts=3,
+                 tracker=None, evidence_writer=None, on_vehicle=None):
+        self.model = model
+        self.reader = reader
+        self.toll_processor = toll_processor
+        self.sample_fps = sample_fps
+        self.motion_threshold = motion_threshold
+        self.min_hits = min_hits
+        self.max_ocr_attempts = max_ocr_attempts
+        self.tracker = tracker or PlateTracker()
+        self.evidence_writer = evidence_writer
+        self.on_vehicle = on_vehicle
+        self._last_small = None
+        self.frames_read = 0
+        self.frames_processed = 0
+
+    def _has_motion(self, frame):
+        if not self.motion_threshold:
+            return True
+        small = cv2.cvtColor(cv2.resize(frame, (160, 90)), cv2.COLOR_BGR2GRAY)
+        previous, self._last_small = self._last_small, small
+        if previous is None:
+            return True
+        return float(np.mean(cv2.absdiff(small, previous))) >= self.motion_threshold
+
+    def process_frame(self, frame, source_name):
+        self.frames_processed += 1
+        METRICS.inc('frames_processed_total')
+        detections = detect_batch(self.model, [frame])[0]
+        if detections is None:
+            detections = ([], [], [])
+
+        kept, crops = [], []
+        for box, conf, cls_id in zip(*detections):
+            # Junk boxes never start a track, so they are never OCRed either
+            reason = box_skip_reason(box, conf, cls_id)
+            if reason is not None:
+                METRICS.inc('boxes_skipped_total', labels={'reason': reason})
+                continue
+            x_min, y_min, x_max, y_max = map(int, box)
+            crop = frame[y_min:y_max, x_min:x_max]
+            if crop.size:
+                kept.append((tuple(float(v) for v in box), float(conf)))
+                crops.append(crop.copy()) # The frame buffer is reused by the capture
+        for track in self.tracker.update([b for b, _ in kept], [c for _, c in kept], crops):
+            self._maybe_read(track, source_name)
+
+    def _maybe_read(self, track, source_name):
+        if track.plate or track.hits < self.min_hits or track.ocr_attempts >= self.max_ocr_attempts:
+            return
+        if track.best_crop is track.ocr_crop:
+            return # Already failed on this crop; wait for a better one
+        track.ocr_crop = track.best_crop
+        track.ocr_attempts += 1
+        candidates = read_plate_candidates(self.reader, track.best_crop)
+        if not candidates:
+            return
+        track.plate = candidates[0]
+        image_ref = evidence_name("track", source_name, track.track_id)
+        if self.evidence_writer is not None:
+            image_ref = self.evidence_writer.save(image_ref, track.best_crop)
+        if self.toll_processor is not None:
+            track.result = self.toll_processor.process_plate(track.plate, image_ref, candidates)
+            track.plate = track.result['plate'] # The registered reading, if any
+        if self.on_vehicle:
+            self.on_vehicle(track)
+
+    def run(self, source):
+        """Process `source` until it ends. Returns the elapsed time in seconds."""
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise IOError(f"Could not open video source {source}")
+        source_fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(1, round(source_fps / self.sample_fps)) if self.sample_fps else 1
+        start = time.perf_counter()
+        try:
+            while True:
+                # grab() skips decoding for the frames we are not sampling
+                if not capture.grab():
+                    break
+                self.frames_read += 1
+                if (self.frames_read - 1) % step:
+                    continue
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                if self._has_motion(frame):
+                    self.process_frame(frame, source)
+        finally:
+            capture.release()
+        return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recognize and charge plates from a video file or camera.")
+    parser.add_argument('source', help="Video file, stream URL or camera index")
+    parser.add_argument('--fps', type=float, default=STREAM_SAMPLE_FPS,
+                        help="Frames per second to analyse (0 = every frame)")
+    parser.add_argument('--motion-threshold', type=float, default=STREAM_MOTION_THRESHOLD,
+                        help="Mean pixel change needed to analyse a sampled frame (0 = always)")
+    parser.add_argument('--min-hits', type=int, default=2, help="Frames a plate must be seen before OCR")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--backend', choices=DETECTOR_BACKENDS, default=DETECTOR_BACKEND, help="Detector runtime")
+    parser.add_argument('--toll-amount', type=float, default=DEFAULT_TOLL_AMOUNT)
+    parser.add_argument('--save-evidence', action='store_true')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help="Serve Prometheus metrics on this local port while running (0 = off)")
+    parser.add_argument('--metrics-json', default=METRICS_JSON_FILE, help="Write metrics as JSON here on exit")
+    parser.add_argument('--dry-run', action='store_true', help="Recognize plates only, do not charge tolls")
+    args = parser.parse_args(argv)
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    model, reader = load_models(args.model, args.backend)
+    storage = None if args.dry_run else open_storage()
+    # The tracker charges each track once; the cache also catches a car that
+    # drops out of view for a moment and comes back as a new track.
+    toll_processor = TollProcessor(storage, args.toll_amount, cache=RecognitionCache()) if storage else None
+    evidence_writer = EvidenceWriter(CROPPED_DIR) if args.save_evidence else None
+
+    def report(track):
+        if track.result:
+            r = track.result
+            duplicate = " [duplicate, not charged]" if r['duplicate'] else ""
+            print(f"Vehicle {track.track_id}: {r['plate']} {r['status']} (owner: {r['owner']}, "
+                  f"balance: {r['balance']}){duplicate}")
+        else:
+            print(f"Vehicle {track.track_id}: {track.plate}")
+
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    processor = StreamProcessor(model, reader, toll_processor, args.fps, args.motion_threshold, args.min_hits,
+                                evidence_writer=evidence_writer, on_vehicle=report)
+    try:
+        elapsed = processor.run(source)
+    finally:
+        if evidence_writer:
+            evidence_writer.close()
+        if storage:
+            storage.close()
+        if args.metrics_json:
+            METRICS.dump_json(args.metrics_json)
+    print(f"Read {processor.frames_read} frames, analysed {processor.frames_processed} in {elapsed:.2f}s "
+          f"({processor.frames_read / elapsed:.1f} source frames/sec)")
+
+
+if __name__ == "__main__":
+    main()
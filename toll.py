@@ -0,0 +1,122 @@
+"""Toll rules and settlement, independent of the Tk UI."""
+import csv
+import os
+from datetime import datetime
+
+from config import (VEHICLES_DB_FILE, TOLL_LOG_FILE, DEFAULT_TOLL_AMOUNT,
+                    VEHICLE_FIELDS, TOLL_LOG_FIELDS)
+from metrics import METRICS
+
+
+def init_csv_files(vehicles_file=VEHICLES_DB_FILE, toll_log_file=TOLL_LOG_FILE):
+    if not os.path.exists(vehicles_file):
+        with open(vehicles_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(VEHICLE_FIELDS)
+            # Add a sample vehicle for testing
+            writer.writerow(['MH20EE7777', 'Test User', 'Car', '50.00'])
+    if not os.path.exists(toll_log_file):
+        with open(toll_log_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(TOLL_LOG_FIELDS)
+
+
+def save_csv(filename, data, fieldnames):
+    # Write a temporary file and swap it in, so a crash mid-write never
+    # leaves a truncated vehicles file behind
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+# Logged for a repeat read that the recognition cache kept from being charged
+DUPLICATE_STATUS = "Duplicate"
+
+
+def decide_toll(vehicle, amount):
+    """The toll rules: returns (status, new balance string or None if no debit)."""
+    if vehicle is None:
+        return "Unpaid - Unregistered", None
+    try:
+        current_balance = float(vehicle.balance)
+    except ValueError:
+        return "Error - Invalid Balance", None
+    if current_balance >= amount:
+        return "Auto-Paid", str(current_balance - amount)
+    return "Unpaid - Low Balance", None
+
+
+class TollProcessor:
+    """Charges detected plates through a storage backend (see storage.py).
+
+    With a RecognitionCache (dedup.py) a plate read again within the cache
+    window gets the earlier decision back, marked 'duplicate'; nothing is
+    charged and the read is logged as DUPLICATE_STATUS.
+    """
+
+    def __init__(self, storage, toll_amount=DEFAULT_TOLL_AMOUNT, cache=None):
+        self.storage = storage
+        self.toll_amount = toll_amount
+        self.cache = cache
+
+    def is_registered(self, plate_number):
+        return self.storage.find_vehicle(plate_number) is not None
+
+    def resolve_plate(self, plate_number, candidates):
+        """The first of `candidates` (other readings of the plate, best first) that is registered.
+
+        Falls back to `plate_number` when none is.
+        """
+        for candidate in candidates:
+            if self.storage.find_vehicle(candidate) is not None:
+                return candidate
+        return plate_number
+
+    def process_plate(self, plate_number, image_ref, candidates=None):
+        """Settle one detected plate.
+
+        `candidates` are the alternative readings from recognition; the
+        first registered one is charged instead of `plate_number`.
+        Returns a dict with 'plate', 'status', 'owner' and 'balance' (the
+        display string shown in the detected plates table) and 'duplicate'.
+        """
+        if candidates:
+            plate_number = self.resolve_plate(plate_number, candidates)
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if self.cache is not None:
+            cached = self.cache.get(plate_number, self.is_registered)
+            if cached is not None:
+                METRICS.inc('toll_duplicates_total')
+                self.storage.charge_tolls([(None, plate_number, self.toll_amount, timestamp, image_ref, True)])
+                return dict(cached, duplicate=True)
+
+        with METRICS.time('settle'):
+            status, vehicle = self.storage.charge_toll(plate_number, self.toll_amount, timestamp, image_ref)
+        METRICS.inc('toll_outcomes_total', labels={'status': status})
+        result = toll_result(plate_number, status, vehicle)
+        if self.cache is not None:
+            self.cache.put(plate_number, result)
+        return result
+
+
+def toll_result(plate_number, status, vehicle, duplicate=False):
+    """The result dict shown for a settled plate (see TollProcessor.process_plate)."""
+    owner = "N/A"
+    balance_val = "N/A"
+
+    if vehicle:
+        owner = vehicle.owner
+        if status == "Auto-Paid":
+            balance_val = f"{float(vehicle.balance):.2f} (Paid)"
+        elif status in ("Unpaid - Low Balance", DUPLICATE_STATUS):
+            balance_val = f"{float(vehicle.balance):.2f}"
+        else:
+            balance_val = vehicle.balance + " (Error)"
+
+    return {'plate': plate_number, 'status': status, 'owner': owner, 'balance': balance_val,
+            'duplicate': duplicate}
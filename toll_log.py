@@ -0,0 +1,256 @@
+"""Append-only toll log.
+
+Every transaction is appended to the CSV and fsynced on its own (or, with
+group commit, together with the other rows of a burst) instead of
+rewriting the whole history. Readers tail the file from a byte offset, so
+refreshing a view only parses the rows added since the last refresh.
+"""
+import bisect
+import csv
+import io
+import os
+import threading
+from datetime import datetime
+
+from metrics import METRICS
+
+from config import (TOLL_LOG_FILE, TOLL_LOG_FIELDS, TOLL_LOG_COMMIT_INTERVAL, TOLL_LOG_MAX_BYTES,
+                    TOLL_LOG_ROTATE_DAILY)
+
+
+class TollLogWriter:
+    """Appends toll log rows to a CSV file.
+
+    With `commit_interval` = 0 every `append` is written and fsynced before it
+    returns. With a positive interval rows are buffered and a background
+    thread commits them in one write + fsync every `commit_interval` seconds
+    (or as soon as `max_pending` rows are waiting), which keeps bursts of
+    cars from queueing behind one fsync each.
+
+    The file is rotated to `<name>.<timestamp>.csv` once it grows past
+    `max_bytes` (0 disables) or, with `rotate_daily`, when the date changes.
+    """
+
+    def __init__(self, filename=TOLL_LOG_FILE, commit_interval=TOLL_LOG_COMMIT_INTERVAL,
+                 max_bytes=TOLL_LOG_MAX_BYTES, rotate_daily=TOLL_LOG_ROTATE_DAILY, max_pending=256):
+        self.filename = filename
+        self.commit_interval = commit_interval
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = []
+        self._file = None
+        self._opened_on = None
+        self._open()
+
+        self._closed = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+        if commit_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="toll-log-commit", daemon=True)
+            self._thread.start()
+
+    def _open(self):
+        self._file = open(self.filename, 'a', newline='', encoding='utf-8')
+        self._opened_on = datetime.now().date()
+        if self._file.tell() == 0:
+            csv.writer(self._file).writerow(TOLL_LOG_FIELDS)
+            self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _should_rotate(self):
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return self.rotate_daily and datetime.now().date() != self._opened_on
+
+    def _rotate(self):
+        self._file.close()
+        base, ext = os.path.splitext(self.filename)
+        rotated = f"{base}.{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        n = 1
+        while os.path.exists(rotated + ext):
+            rotated = f"{base}.{datetime.now().strftime('%Y%m%d-%H%M%S')}-{n}"
+            n += 1
+        os.replace(self.filename, rotated + ext)
+        self._open()
+
+    def append(self, entry):
+        """Append one row (a dict with the TOLL_LOG_FIELDS keys)."""
+        with self._lock:
+            self._pending.append(entry)
+            if self._thread is None:
+                self._commit()
+            elif len(self._pending) >= self.max_pending:
+                self._wakeup.set()
+
+    def append_many(self, entries):
+        """Append several rows with a single write + fsync.
+
+        Without a commit thread a failed write raises and the rows are
+        dropped, so the caller can treat them as not logged.
+        """
+        if not entries:
+            return
+        with self._lock:
+            self._pending.extend(entries)
+            if self._thread is None:
+                try:
+                    self._commit()
+                except Exception:
+                    del self._pending[-len(entries):]
+                    raise
+            elif len(self._pending) >= self.max_pending:
+                self._wakeup.set()
+
+    def flush(self):
+        """Write and fsync any buffered rows now."""
+        with self._lock:
+            self._commit()
+
+    def _commit(self):
+        if not self._pending:
+            return
+        if self._should_rotate():
+            self._rotate()
+        buf = io.StringIO()
+        csv.DictWriter(buf, fieldnames=TOLL_LOG_FIELDS).writerows(self._pending)
+        with METRICS.time('toll_log_commit'):
+            self._file.write(buf.getvalue())
+            self._sync()
+        self._pending.clear()
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wakeup.wait(self.commit_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error committing toll log: {e}")
+
+    def close(self):
+        self._closed.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            self._commit()
+            self._file.close()
+
+
+class TollLogReader:
+    """Tails a toll log CSV from a byte offset.
+
+    `read_new()` returns only the rows appended since the previous call and
+    ignores a trailing partial line until it is complete. If the file was
+    rotated or truncated the reader starts over and sets `reset` so views
+    know to clear what they showed.
+    """
+
+    def __init__(self, filename=TOLL_LOG_FILE, offset=0):
+        self.filename = filename
+        self.offset = offset
+        self.reset = False
+        self._inode = None
+
+    def read_new(self):
+        self.reset = False
+        try:
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            return []
+        if (self._inode is not None and st.st_ino != self._inode) or st.st_size < self.offset:
+            self.offset = 0
+            self.reset = True
+        self._inode = st.st_ino
+
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(st.st_size - self.offset)
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            return []
+        text = chunk[:end].decode('utf-8')
+        start_offset = self.offset
+        self.offset += end
+
+        rows = csv.DictReader(io.StringIO(text, newline=''), fieldnames=TOLL_LOG_FIELDS)
+        if start_offset == 0:
+            next(rows, None) # Skip the header line
+        return list(rows)
+
+
+class LogIndex:
+    """In-memory toll log rows with indexes for filtering views.
+
+    Rows are kept as tuples in TOLL_LOG_FIELDS order and addressed by their
+    position. Plates and statuses map to the positions they occur at; dates
+    are found by bisecting the timestamps, which works because rows are
+    appended in time order. Filtering never rereads the file.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def clear(self):
+        self.rows = []
+        self._timestamps = []
+        self._by_plate = {}
+        self._by_status = {}
+
+    def append(self, entries):
+        """Add TollLogReader rows. Returns the positions of the new rows."""
+        start = len(self.rows)
+        for entry in entries:
+            row = tuple(entry.get(field) or '' for field in TOLL_LOG_FIELDS)
+            position = len(self.rows)
+            self.rows.append(row)
+            self._timestamps.append(row[0])
+            self._by_plate.setdefault(row[1].upper(), []).append(position)
+            self._by_status.setdefault(row[3], []).append(position)
+        return range(start, len(self.rows))
+
+    def statuses(self):
+        return sorted(self._by_status)
+
+    def _date_range(self, start_date, end_date):
+        lo = bisect.bisect_left(self._timestamps, start_date) if start_date else 0
+        # '~' sorts after any time of day, so the whole end date is included
+        hi = bisect.bisect_right(self._timestamps, end_date + '~') if end_date else len(self.rows)
+        return lo, hi
+
+    def query(self, plate=None, status=None, start_date=None, end_date=None):
+        """Positions of rows matching every given filter, in log order.
+
+        `plate` matches exactly (case-insensitive); dates are YYYY-MM-DD
+        strings and both ends are inclusive.
+        """
+        lo, hi = self._date_range(start_date, end_date)
+        lists = []
+        if plate:
+            lists.append(self._by_plate.get(plate.upper(), []))
+        if status:
+            lists.append(self._by_status.get(status, []))
+        if not lists:
+            return list(range(lo, hi))
+        # Walk the shortest index list and check the other filters per row
+        lists.sort(key=len)
+        others = [set(positions) for positions in lists[1:]]
+        first = lists[0]
+        return [p for p in first[bisect.bisect_left(first, lo):bisect.bisect_left(first, hi)]
+                if all(p in other for other in others)]
+
+    def matches(self, position, plate=None, status=None, start_date=None, end_date=None):
+        """Whether the row at `position` passes the same filters as query()."""
+        row = self.rows[position]
+        return ((not plate or row[1].upper() == plate.upper())
+                and (not status or row[3] == status)
+                and (not start_date or row[0] >= start_date)
+                and (not end_date or row[0] <= end_date + '~'))
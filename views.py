@@ -0,0 +1,136 @@
+"""Paged Treeview tables for the Tk app.
+
+A Treeview slows down badly with hundreds of thousands of items, so
+PagedView keeps only the rows of the current page in the widget. The full
+table is a list of keys plus a function that returns the values for a key;
+adding, changing or removing a row only touches the widget when that row is
+on screen.
+"""
+import tkinter as tk
+from tkinter import ttk
+
+from config import VIEW_PAGE_SIZE
+
+
+class PagedView:
+    """A Treeview with Previous/Next paging under it.
+
+    Rows are identified by `keys` (plates, log positions, ...); `values_of(key)`
+    returns the tuple of column values. The Treeview item id of a row is
+    `str(key)`, so selections still map back to keys.
+    """
+
+    def __init__(self, parent, columns, values_of, page_size=VIEW_PAGE_SIZE, height=10, width=120,
+                 headings=None):
+        self.values_of = values_of
+        self.page_size = page_size
+        self.keys = []
+        self.page = 0
+        self._positions = None # key -> index in self.keys, built on demand
+
+        table = ttk.Frame(parent)
+        table.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(table, columns=columns, show='headings', height=height)
+        for col in columns:
+            heading = headings[col] if headings else col.replace('_', ' ').title()
+            self.tree.heading(col, text=heading)
+            self.tree.column(col, width=width, anchor=tk.W)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb = ttk.Scrollbar(table, orient="vertical", command=self.tree.yview)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.configure(yscrollcommand=vsb.set)
+
+        pager = ttk.Frame(parent)
+        pager.pack(fill=tk.X)
+        ttk.Button(pager, text="< Previous", command=lambda: self.show_page(self.page - 1)).pack(side=tk.LEFT)
+        ttk.Button(pager, text="Next >", command=lambda: self.show_page(self.page + 1)).pack(side=tk.LEFT)
+        self.page_label = ttk.Label(pager, text="")
+        self.page_label.pack(side=tk.LEFT, padx=10)
+
+    @property
+    def last_page(self):
+        return max(0, (len(self.keys) - 1) // self.page_size)
+
+    def _page_bounds(self):
+        start = self.page * self.page_size
+        return start, min(start + self.page_size, len(self.keys))
+
+    def _update_label(self):
+        start, end = self._page_bounds()
+        shown = f"{start + 1}-{end}" if end > start else "0"
+        self.page_label.config(
+            text=f"Rows {shown} of {len(self.keys)} (page {self.page + 1} of {self.last_page + 1})")
+
+    def _index(self, key):
+        if self._positions is None:
+            self._positions = {k: i for i, k in enumerate(self.keys)}
+        return self._positions.get(key)
+
+    def _on_page(self, index):
+        start, end = self._page_bounds()
+        return index is not None and start <= index < end
+
+    def set_keys(self, keys, page=0):
+        """Replace the whole table and show `page` (clamped; -1 for the last page)."""
+        self.keys = list(keys)
+        self._positions = None
+        self.show_page(self.last_page if page == -1 else page)
+
+    def show_page(self, page):
+        self.page = min(max(page, 0), self.last_page)
+        self.tree.delete(*self.tree.get_children())
+        start, end = self._page_bounds()
+        for key in self.keys[start:end]:
+            self.tree.insert('', tk.END, iid=str(key), values=self.values_of(key))
+        self._update_label()
+
+    def append(self, keys):
+        """Add rows at the end. A view on the last page follows the new rows."""
+        if not keys:
+            return
+        following = self.page == self.last_page
+        for key in keys:
+            if self._positions is not None:
+                self._positions[key] = len(self.keys)
+            self.keys.append(key)
+        if not following:
+            self._update_label()
+        elif self.last_page != self.page:
+            self.show_page(self.last_page)
+        else:
+            start = len(self.keys) - len(keys)
+            for key in self.keys[start:]:
+                self.tree.insert('', tk.END, iid=str(key), values=self.values_of(key))
+            self._update_label()
+
+    def refresh(self, key):
+        """Redraw the row for `key` if it is on screen, or add it if it is new."""
+        index = self._index(key)
+        if index is None:
+            self.append([key])
+        elif self._on_page(index):
+            self.tree.item(str(key), values=self.values_of(key))
+
+    def replace(self, old_key, new_key):
+        """Give the row of `old_key` a new key (e.g. a renamed plate) in place."""
+        index = self._index(old_key)
+        if index is None:
+            self.append([new_key])
+            return
+        self.keys[index] = new_key
+        del self._positions[old_key]
+        self._positions[new_key] = index
+        if self._on_page(index):
+            self.show_page(self.page) # Item ids cannot be changed, redraw the page
+
+    def remove(self, key):
+        index = self._index(key)
+        if index is None:
+            return
+        _, end = self._page_bounds()
+        del self.keys[index]
+        self._positions = None # Positions after it have shifted
+        if index < end: # The page on screen moves up by one row
+            self.show_page(self.page)
+        else:
+            self._update_label()